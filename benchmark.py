@@ -0,0 +1,649 @@
+import argparse
+import asyncio
+import contextlib
+import csv
+import glob
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import deque
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+import openpyxl
+
+import gsheet_to_xlsx as g
+
+# Ensure UTF-8 encoding for console output
+sys.stdout.reconfigure(encoding='utf-8')
+
+BENCHMARK_COLUMN_MAPPING = {
+    'src_common_info_id': ['A', 'B', 'C', 'D', 'E'],
+    'src_common_info_names': ['Timestamp', 'Block', 'Floor', 'Home', 'Owner'],
+
+    'src_owner_info_id': ['F', 'G', 'H', 'I', 'J'],
+    'src_owner_info_names': ['Full Name', 'ID', 'Sex', 'Birthday', 'Phone'],
+
+    'src_owner_info_next_id': 'K',
+
+    'src_member_info_id': ['L', 'M', 'N', 'O', 'P', 'Q'],
+    'src_member_info_names': ['Full Name', 'ID', 'Sex', 'Birthday', 'Relationship', 'Phone'],
+    'src_member_info_next_id': 'R',
+
+    'dest_common_info_ids': ['A', 'B', 'C', 'D'],
+    'dest_common_info_names': ['STT', 'BLOCK', 'MÃ CĂN HỘ', 'CHÍNH CHỦ/THUÊ'],
+
+    'dest_member_info_ids': ['E', 'F', 'G', 'H', 'I', 'J'],
+    'dest_member_info_names': ['HỌ VÀ TÊN', 'CCCD', 'GIỚI TÍNH', 'NGÀY/THÁNG/NĂM SINH', 'SĐT', 'QH VỚI CHỦ HỘ/NGƯỜI THUÊ'],
+
+    'dest_additional_info_ids': ['K', 'L', 'M'],
+    'dest_additional_info_names': ['THÔNG TIN CHỦ CŨ', 'THÔNG TIN CHỦ HỘ', 'G-Row ID'],
+
+    'dest_merge_cells_ids': ['A', 'B', 'C', 'D', 'K', 'L', 'M'],
+    'dest_merge_cells_names': ['STT', 'BLOCK', 'MÃ CĂN HỘ', 'CHÍNH CHỦ/THUÊ', 'THÔNG TIN CHỦ CŨ', 'THÔNG TIN CHỦ HỘ', 'G-Row ID'],
+
+    'dest_group_by_id': 'C',
+    'dest_group_by_name': 'MÃ CĂN HỘ',
+
+    'dest_categorical_names': ['BLOCK', 'CHÍNH CHỦ/THUÊ', 'GIỚI TÍNH', 'QH VỚI CHỦ HỘ/NGƯỜI THUÊ', 'THÔNG TIN CHỦ CŨ', 'THÔNG TIN CHỦ HỘ'],
+
+    'normalize_name_idx': 0,
+    'normalize_birthday_idx': 3,
+    'normalize_phone_idx': 4,
+    'normalize_relationship_idx': 5
+}
+
+LAST_NAMES = ['Nguyễn', 'Trần', 'Lê', 'Phạm', 'Hoàng', 'Huỳnh', 'Phan', 'Vũ', 'Võ', 'Đặng', 'Bùi', 'Đỗ', 'Hồ', 'Ngô', 'Dương', 'Lý']
+MIDDLE_NAMES = ['Văn', 'Thị', 'Hữu', 'Đức', 'Minh', 'Ngọc', 'Thanh', 'Quốc', 'Thu', 'Kim', '']
+FIRST_NAMES = ['An', 'Bình', 'Cường', 'Dung', 'Giang', 'Hà', 'Hải', 'Hạnh', 'Hùng', 'Hương', 'Khánh', 'Lan', 'Linh', 'Long',
+               'Mai', 'Nam', 'Nga', 'Phúc', 'Phương', 'Quân', 'Sơn', 'Tâm', 'Thảo', 'Trang', 'Tuấn', 'Vy', 'Yến']
+RELATIONSHIPS = ['vợ', 'chồng', 'con', 'CON', 'Bố', 'mẹ', 'anh', 'chị', 'em', 'cháu', 'người thuê']
+BLOCKS = ['A1', 'A2', 'B1', 'B2', 'C1', 'C2']
+
+HEADER = ['Dấu thời gian', 'Block', 'Tầng', 'Căn hộ', 'Chính chủ/Thuê',
+          'Họ và tên chủ hộ', 'CCCD', 'Giới tính', 'Ngày sinh', 'Số điện thoại', 'Có thêm thành viên?']
+MEMBER_HEADER = ['Họ và tên', 'CCCD', 'Giới tính', 'Ngày sinh', 'Quan hệ với chủ hộ', 'Số điện thoại', 'Có thêm thành viên?']
+
+
+def random_name(rng):
+    """
+    Create a random Vietnamese full name with a random letter case, like form answers.
+    """
+    name = ' '.join(part for part in (rng.choice(LAST_NAMES), rng.choice(MIDDLE_NAMES), rng.choice(FIRST_NAMES)) if part)
+    return rng.choice([name, name.lower(), name.upper(), '  ' + name])
+
+
+def random_phone(rng):
+    """
+    Create a random phone number in one of the formats seen in the form.
+    """
+    digits = '0' + ''.join(rng.choice('0123456789') for _ in range(9))
+    return rng.choice([digits, f'{digits[:4]} {digits[4:7]} {digits[7:]}', f'+84 {digits[1:]}', digits[:4] + '.' + digits[4:]])
+
+
+def random_birthday(rng, start_year, end_year):
+    """
+    Create a random birthday in the form format m/d/YYYY.
+    """
+    return f'{rng.randint(1, 12)}/{rng.randint(1, 28)}/{rng.randint(start_year, end_year)}'
+
+
+def generate_survey_values(row_count, seed=0, max_members=6, duplicate_rate=0.05, homes_per_floor=12):
+    """
+    Generate a synthetic survey sheet (header first) with variable member counts
+    in the repeating member column groups and duplicate submissions.
+    """
+    rng = random.Random(seed)
+    # Enough floors for every household to be unique apart from the resubmissions
+    floors = row_count // (len(BLOCKS) * homes_per_floor) + 1
+    homes = [(block, f'Tầng {floor}', f'Căn hộ {home:02d}')
+             for block in BLOCKS for floor in range(1, floors + 1) for home in range(1, homes_per_floor + 1)]
+    rng.shuffle(homes)
+    start = datetime(2025, 1, 1)
+    # The last member group has no "more members" question
+    widest = len(HEADER) + max_members * len(MEMBER_HEADER) - 1
+    header = HEADER + [f'{name} {i + 1}' for i in range(max_members) for name in MEMBER_HEADER]
+    values = [header[:widest]]
+    submitted = []
+
+    for _ in range(row_count):
+        timestamp = start + timedelta(seconds=rng.randint(0, 365 * 86400))
+        if submitted and rng.random() < duplicate_rate:
+            # Resubmission of an existing household
+            block, floor, home = rng.choice(submitted)
+        else:
+            block, floor, home = homes.pop()
+            submitted.append((block, floor, home))
+
+        member_count = min(int(rng.expovariate(0.6)), max_members)
+        row = [timestamp.strftime('%m/%d/%Y %H:%M:%S'), block, floor, home, rng.choice(['Chính chủ', 'Thuê']),
+               random_name(rng), f'{rng.randint(0, 10**12 - 1):012d}', rng.choice(['Nam', 'Nữ']),
+               random_birthday(rng, 1940, 2000), random_phone(rng), g.YES if member_count else g.NO]
+        for i in range(member_count):
+            row += [random_name(rng), f'{rng.randint(0, 10**12 - 1):012d}', rng.choice(['Nam', 'Nữ']),
+                    random_birthday(rng, 1950, 2024), rng.choice(RELATIONSHIPS), rng.choice([random_phone(rng), ''])]
+            if i < member_count - 1:
+                row.append(g.YES)
+            elif member_count < max_members:
+                row.append(g.NO)
+        values.append(row)
+
+    return values
+
+
+class FakeRequest:
+    """
+    Stand-in for a googleapiclient HttpRequest: execute() returns the response
+    after a JSON round trip, like a real response body.
+    """
+
+    def __init__(self, service, response):
+        self.service = service
+        self.response = response
+
+    def execute(self, http=None, num_retries=0):
+        body = json.dumps(self.response, ensure_ascii=False)
+        self.service.api_calls += 1
+        self.service.bytes_fetched += len(body.encode('utf-8'))
+        if self.service.latency:
+            time.sleep(self.service.latency)
+        return json.loads(body)
+
+
+class FakeValues:
+    def __init__(self, service):
+        self.service = service
+
+    def get(self, spreadsheetId, range, fields=None, **kwargs):
+        return FakeRequest(self.service, self.service.value_range(spreadsheetId, range))
+
+    def batchGet(self, spreadsheetId, ranges, fields=None, **kwargs):
+        return FakeRequest(self.service, {
+            'spreadsheetId': spreadsheetId,
+            'valueRanges': [self.service.value_range(spreadsheetId, a1_range) for a1_range in ranges],
+        })
+
+
+class FakeSpreadsheets:
+    def __init__(self, service):
+        self.service = service
+
+    def get(self, spreadsheetId, fields=None, **kwargs):
+        return FakeRequest(self.service, self.service.metadata(spreadsheetId))
+
+    def values(self):
+        return FakeValues(self.service)
+
+
+class FakeSheetsService:
+    """
+    Local stand-in for the Sheets API v4 client serving in-memory sheets through
+    spreadsheets().get, spreadsheets().values().get and spreadsheets().values().batchGet.
+
+    :param spreadsheets: A dict of spreadsheet id -> {sheet title: values}.
+    :param latency: Seconds added to every request to simulate the network.
+    """
+
+    A1_RE = re.compile(r"^(?:'((?:[^']|'')*)'|([^!]+))!([A-Z]+)(\d+)?(?::([A-Z]+)(\d+)?)?$")
+
+    def __init__(self, spreadsheets, latency=0):
+        self.spreadsheets_data = spreadsheets
+        self.latency = latency
+        self.api_calls = 0
+        self.bytes_fetched = 0
+
+    def spreadsheets(self):
+        return FakeSpreadsheets(self)
+
+    def metadata(self, spreadsheet_id):
+        sheets = []
+        for index, (title, values) in enumerate(self.spreadsheets_data[spreadsheet_id].items()):
+            sheets.append({'properties': {
+                'sheetId': index,
+                'title': title,
+                'index': index,
+                'gridProperties': {
+                    'rowCount': max(len(values), 1),
+                    'columnCount': max((len(row) for row in values), default=1),
+                },
+            }})
+        return {'spreadsheetId': spreadsheet_id, 'sheets': sheets}
+
+    def value_range(self, spreadsheet_id, a1_range):
+        match = self.A1_RE.match(a1_range)
+        if not match:
+            raise ValueError(f"Unable to parse range: {a1_range}")
+        title = match.group(1).replace("''", "'") if match.group(1) is not None else match.group(2)
+        values = self.spreadsheets_data[spreadsheet_id][title]
+
+        first_col = g.excel_col_to_index(match.group(3))
+        first_row = int(match.group(4) or 1) - 1
+        last_col = g.excel_col_to_index(match.group(5)) if match.group(5) else first_col
+        last_row = int(match.group(6)) if match.group(6) else len(values)
+
+        rows = [row[first_col:last_col + 1] for row in values[first_row:last_row]]
+        # The API trims trailing empty rows
+        while rows and not rows[-1]:
+            rows.pop()
+        response = {'range': a1_range, 'majorDimension': 'ROWS'}
+        if rows:
+            response['values'] = rows
+        return response
+
+
+class FakeSheetsHandler(BaseHTTPRequestHandler):
+    """
+    Answer the Sheets API v4 and Drive API v3 GET requests of the fetch layer.
+    """
+
+    def do_GET(self):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        failure = server.failure()
+        if failure:
+            status, message = failure
+            headers = {'Retry-After': str(server.retry_after)} if status == 429 and server.retry_after is not None else {}
+            return self.send_json(status, {'error': {'code': status, 'message': message}}, headers)
+
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = [unquote(part) for part in url.path.strip('/').split('/')]
+        try:
+            if parts[:2] == ['drive', 'v3'] and parts[2] == 'files':
+                body = {'version': server.versions.get(parts[3], '1')}
+            elif parts[:2] == ['v4', 'spreadsheets'] and len(parts) == 3:
+                if parts[2].endswith(':batchGet'):
+                    raise KeyError(parts[2])
+                body = server.service.metadata(parts[2])
+            elif parts[:2] == ['v4', 'spreadsheets'] and parts[3] == 'values:batchGet':
+                body = {'spreadsheetId': parts[2],
+                        'valueRanges': [server.service.value_range(parts[2], a1_range) for a1_range in query.get('ranges', [])]}
+            elif parts[:2] == ['v4', 'spreadsheets'] and parts[3] == 'values':
+                body = server.service.value_range(parts[2], parts[4])
+            else:
+                raise KeyError(url.path)
+        except (KeyError, IndexError, ValueError) as e:
+            return self.send_json(404, {'error': {'code': 404, 'message': f"Not found: {e}"}})
+        self.send_json(200, body)
+
+    def send_json(self, status, body, headers={}):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeSheetsServer(ThreadingHTTPServer):
+    """
+    Local HTTP server serving in-memory spreadsheets like the Sheets and Drive APIs, with
+    injected throttling: 429 beyond quota requests per quota_window seconds and random
+    503 at error_rate. Use it as a context manager and point the clients at url.
+
+    :param spreadsheets: A dict of spreadsheet id -> {sheet title: values}, see FakeSheetsService.
+    :param retry_after: The Retry-After seconds sent with the 429 responses, None to omit it.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, spreadsheets, quota=None, quota_window=60, error_rate=0, latency=0, retry_after=None, seed=0):
+        super().__init__(('127.0.0.1', 0), FakeSheetsHandler)
+        self.service = FakeSheetsService(spreadsheets)
+        self.versions = {}
+        self.quota = quota
+        self.quota_window = quota_window
+        self.error_rate = error_rate
+        self.latency = latency
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.recent = deque()
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def failure(self):
+        """
+        Count a request and get the (status, message) of the injected failure, if any.
+        """
+        with self.lock:
+            self.requests += 1
+            now = time.monotonic()
+            while self.recent and now - self.recent[0] >= self.quota_window:
+                self.recent.popleft()
+            if self.quota is not None and len(self.recent) >= self.quota:
+                self.throttled += 1
+                return 429, 'Quota exceeded for quota metric Read requests per minute per user'
+            self.recent.append(now)
+            if self.rng.random() < self.error_rate:
+                self.errors += 1
+                return 503, 'The service is currently unavailable'
+        return None
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+    def clients(self):
+        """
+        Build Sheets and Drive clients talking to this server.
+        """
+        import httplib2
+        from googleapiclient.discovery import build_from_document
+        sheets = build_from_document(g.discovery_document('sheets', 'v4'), http=httplib2.Http(),
+                                     client_options={'api_endpoint': f"{self.url}/"})
+        drive = build_from_document(g.discovery_document('drive', 'v3'), http=httplib2.Http(),
+                                    client_options={'api_endpoint': f"{self.url}/drive/v3/"})
+        return sheets, drive
+
+
+# Cold start: seconds a bare import or --help of the script may take, and the
+# dependencies that must not be loaded by the import alone
+STARTUP_TARGET_SECONDS = 0.15
+HEAVY_MODULES = ['pandas', 'openpyxl', 'googleapiclient', 'google_auth_oauthlib', 'google.oauth2']
+SCRIPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gsheet_to_xlsx.py')
+
+
+def clear_normalize_caches():
+    """
+    Clear the caches of the normalizers so every run starts cold.
+    """
+    for func in (g.normalize_capitalize, g.normalize_date, g.normalize_phone_number, g.regex_extract_number, g.createHomeID):
+        func.cache_clear()
+
+
+def timed(results, stage, func, *args):
+    """
+    Run func(*args) and record its wall time in seconds under stage.
+    """
+    start = time.perf_counter()
+    result = func(*args)
+    results[stage] = round(time.perf_counter() - start, 6)
+    return result
+
+
+def benchmark_size(row_count, seed=0, tmp_dir=None):
+    """
+    Time every stage of the conversion on a synthetic sheet of row_count responses.
+    """
+    plan = g.compile_column_mapping(BENCHMARK_COLUMN_MAPPING)
+    values = generate_survey_values(row_count, seed)
+    service = FakeSheetsService({'bench': {'Form Responses 1': values}})
+    results = {}
+
+    # fetch: metadata and values through the local stand-in of the API
+    def fetch():
+        spreadsheet = service.spreadsheets().get(spreadsheetId='bench', fields=g.SPREADSHEET_FIELDS).execute()
+        sheets = g.select_sheets(spreadsheet)
+        return g.fetch_sheet_values(service, 'bench', sheets)['Form Responses 1']
+    fetched = timed(results, 'fetch', fetch)
+    results['api_calls'] = service.api_calls
+    results['bytes_fetched'] = service.bytes_fetched
+
+    clear_normalize_caches()
+    rows = [row + [''] * (len(fetched[0]) - len(row)) + [idx] for idx, row in enumerate(fetched[1:], start=1)]
+
+    # dedup/sort: HomeID and timestamp columns, latest response per HomeID, sort
+    def dedup_sort():
+        home_ids = g.create_home_ids([row[plan.block_idx] for row in rows], [row[plan.floor_idx] for row in rows],
+                                     [row[plan.home_idx] for row in rows])
+        timestamps = g.string_to_timestamps([row[plan.timestamp_idx] for row in rows])
+        kept, duplicates = g.dedup_latest_responses([row[-1] for row in rows], home_ids, timestamps)
+        kept.sort(key=lambda i: home_ids[i])
+        return [rows[i] for i in kept], duplicates
+    kept_rows, duplicates = timed(results, 'dedup_sort', dedup_sort)
+    results['duplicates'] = len(duplicates)
+
+    # normalization: owner fields of every kept response
+    def normalize():
+        for row in kept_rows:
+            g.normalize_capitalize(row[plan.owner_idx[plan.normalize_name_idx]])
+            g.normalize_date(row[plan.owner_idx[plan.normalize_birthday_idx]])
+            g.normalize_phone_number(row[plan.owner_idx[plan.normalize_phone_idx]])
+    timed(results, 'normalize', normalize)
+
+    # member expansion: repeating member column groups of the whole sheet at once
+    def expand_members():
+        positions, _, _ = g.expand_households(kept_rows, plan)
+        return len(positions) - len(set(positions))
+    results['member_rows'] = timed(results, 'member_expansion', expand_members)
+
+    # DataFrame build: the whole process_sheet_data on cold caches
+    clear_normalize_caches()
+    df = timed(results, 'process_sheet_data', g.process_sheet_data, [list(row) for row in fetched], plan)
+    results['rows_in'] = row_count
+    results['rows_out'] = len(df)
+
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as out_dir:
+        # write: unstyled write-only dump of the same rows
+        def write_plain():
+            wb = openpyxl.Workbook(write_only=True)
+            ws = wb.create_sheet('Form Responses 1')
+            ws.append(list(df.columns))
+            for row in df.itertuples(index=False):
+                ws.append(list(row))
+            wb.save(os.path.join(out_dir, 'plain.xlsx'))
+        timed(results, 'write', write_plain)
+
+        # styling/merge: the styled writer minus the plain write
+        timed(results, 'styled_write', g.save_styled_excel, os.path.join(out_dir, 'styled.xlsx'), [('Form Responses 1', df)], plan)
+        results['styling_merge'] = round(max(results['styled_write'] - results['write'], 0), 6)
+
+    results['total'] = round(results['fetch'] + results['process_sheet_data'] + results['styled_write'], 6)
+    results['rows_per_second'] = round(row_count / results['total'], 1) if results['total'] else None
+    return results
+
+
+def benchmark_memory(row_count, seed=0):
+    """
+    Measure the memory of the processed result on a synthetic sheet: the peak traced while
+    processing with and without categorical columns, and the size of the result against
+    the same frame held as Python objects.
+    """
+    values = generate_survey_values(row_count, seed)
+    plain_mapping = {key: value for key, value in BENCHMARK_COLUMN_MAPPING.items() if key != 'dest_categorical_names'}
+    results = {'rows_in': row_count}
+    for name, mapping in (('plain', plain_mapping), ('compact', BENCHMARK_COLUMN_MAPPING)):
+        rows = [list(row) for row in values]
+        clear_normalize_caches()
+        tracemalloc.start()
+        with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+            df = g.process_sheet_data(rows, mapping)
+        results[f'{name}_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results[f'{name}_frame_bytes'] = int(df.memory_usage(deep=True).sum())
+    results['object_frame_bytes'] = int(df.astype(object).memory_usage(deep=True).sum())
+    results['frame_reduction'] = round(1 - results['compact_frame_bytes'] / results['object_frame_bytes'], 3)
+    return results
+
+
+def benchmark_fetch(spreadsheet_count=12, row_count=500, seed=0, quota=20, quota_window=1.0, error_rate=0.1, concurrency=4):
+    """
+    Fetch synthetic spreadsheets through the FetchScheduler from a local FakeSheetsServer
+    that throttles beyond quota requests per quota_window seconds and fails error_rate of
+    the requests, and check that every sheet still arrives complete.
+    """
+    spreadsheets = {f'ward-{i}': {'Form Responses 1': generate_survey_values(row_count, seed + i)} for i in range(spreadsheet_count)}
+    # Ask for more than the server quota so the scheduler has to back off
+    scheduler = g.FetchScheduler(None, rate_per_minute=quota * 60 / quota_window * 2, burst=quota, concurrency=concurrency,
+                                 max_retries=10, backoff_base=0.05, backoff_max=1.0)
+
+    with FakeSheetsServer(spreadsheets, quota, quota_window, error_rate, seed=seed) as server, \
+            tempfile.TemporaryDirectory() as cache_dir:
+        service, drive = server.clients()
+
+        async def fetch_all():
+            return await asyncio.gather(*(g.fetch_spreadsheet_async(scheduler, spreadsheet_id, [0], True, cache_dir, service, drive)
+                                          for spreadsheet_id in spreadsheets))
+
+        start = time.perf_counter()
+        with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+            fetched = asyncio.run(fetch_all())
+        wall_time = time.perf_counter() - start
+
+        complete = all(sheet_values == [(title, values) for title, values in sheets.items()]
+                       for sheet_values, sheets in zip(fetched, spreadsheets.values()))
+        results = {
+            'spreadsheets': spreadsheet_count,
+            'complete': complete,
+            'wall_time': round(wall_time, 6),
+            'server_requests': server.requests,
+            'server_throttled': server.throttled,
+            'server_errors': server.errors,
+        }
+    results.update(scheduler.report())
+    return results
+
+
+def benchmark_batch(file_count=6, row_count=500, seed=0, jobs=2, timeout=300):
+    """
+    Convert synthetic CSV exports with the batch mode of the script, which reads them in
+    fetch threads while the worker processes start, and check that it neither hangs nor fails.
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        paths = []
+        for i in range(file_count):
+            path = os.path.join(work_dir, f'ward-{i}.csv')
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                csv.writer(f).writerows(generate_survey_values(row_count, seed + i))
+            paths.append(path)
+        output_dir = os.path.join(work_dir, 'output')
+
+        start = time.perf_counter()
+        try:
+            completed = subprocess.run([sys.executable, SCRIPT_PATH, *paths, output_dir, '--jobs', str(jobs)],
+                                       stdout=subprocess.DEVNULL, timeout=timeout, cwd=os.path.dirname(SCRIPT_PATH))
+            hung, succeeded = False, completed.returncode == 0
+        except subprocess.TimeoutExpired:
+            hung, succeeded = True, False
+        wall_time = time.perf_counter() - start
+        converted = len(glob.glob(os.path.join(output_dir, '*.xlsx')))
+
+    return {
+        'files': file_count,
+        'jobs': jobs,
+        'converted': converted,
+        'hung': hung,
+        'succeeded': succeeded,
+        'wall_time': round(wall_time, 6),
+    }
+
+
+def time_command(command, repeat):
+    """
+    Run a command in a fresh interpreter repeat times and return the fastest wall time in seconds.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, cwd=os.path.dirname(SCRIPT_PATH))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 6)
+
+
+def benchmark_startup(repeat=5):
+    """
+    Time the cold start of the script: a bare import, --help and the first Sheets client built
+    from the bundled discovery document, against an empty interpreter as baseline.
+    """
+    check_modules = f"import sys, gsheet_to_xlsx; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    loaded = subprocess.run([sys.executable, '-c', check_modules], check=True, capture_output=True, text=True,
+                            cwd=os.path.dirname(SCRIPT_PATH)).stdout.strip()
+    build_client = ("import gsheet_to_xlsx as g; from google.oauth2.credentials import Credentials; "
+                    "g.build_service('sheets', 'v4', Credentials(token='benchmark'))")
+    results = {
+        'interpreter': time_command([sys.executable, '-c', 'pass'], repeat),
+        'import': time_command([sys.executable, '-c', 'import gsheet_to_xlsx'], repeat),
+        'help': time_command([sys.executable, SCRIPT_PATH, '--help'], repeat),
+        'build_service': time_command([sys.executable, '-c', build_client], repeat),
+        'heavy_modules_on_import': loaded.split(',') if loaded else [],
+        'target': STARTUP_TARGET_SECONDS,
+    }
+    results['import_over_interpreter'] = round(results['import'] - results['interpreter'], 6)
+    results['help_over_interpreter'] = round(results['help'] - results['interpreter'], 6)
+    results['meets_target'] = (results['import_over_interpreter'] <= STARTUP_TARGET_SECONDS
+                               and results['help_over_interpreter'] <= STARTUP_TARGET_SECONDS
+                               and not results['heavy_modules_on_import'])
+    return results
+
+
+def run_benchmarks(sizes, seed=0, repeat=1):
+    """
+    Run the benchmark at every size and keep the fastest of repeat runs per stage.
+    """
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': seed,
+        'repeat': repeat,
+        'sizes': {},
+    }
+    for size in sizes:
+        best = None
+        for _ in range(repeat):
+            # Silence the per-row warnings of the pipeline
+            with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+                results = benchmark_size(size, seed)
+            best = results if best is None else {key: min(value, results[key]) if isinstance(value, float) else value
+                                                 for key, value in best.items()}
+        report['sizes'][str(size)] = best
+        print(f"* {size} rows: total {best['total']:.3f}s, {best['rows_per_second']} rows/s")
+
+    memory = report['memory'] = benchmark_memory(max(sizes), seed)
+    print(f"* Memory at {max(sizes)} rows: result {memory['compact_frame_bytes'] / 2**20:.1f} MiB compact vs "
+          f"{memory['object_frame_bytes'] / 2**20:.1f} MiB as objects, peak {memory['compact_peak_bytes'] / 2**20:.1f} MiB "
+          f"vs {memory['plain_peak_bytes'] / 2**20:.1f} MiB without categoricals")
+
+    fetch = report['fetch_scheduler'] = benchmark_fetch(seed=seed)
+    print(f"* Fetch scheduler: {fetch['spreadsheets']} spreadsheets complete: {fetch['complete']} in {fetch['wall_time']:.2f}s, "
+          f"{fetch['server_throttled']} throttled and {fetch['server_errors']} failed responses, {fetch['retries']} retries, "
+          f"latency p50 {fetch['latency_p50']:.3f}s p95 {fetch['latency_p95']:.3f}s")
+
+    batch = report['batch'] = benchmark_batch(seed=seed)
+    print(f"* Batch: {batch['converted']}/{batch['files']} files with {batch['jobs']} workers in {batch['wall_time']:.2f}s, "
+          f"hung: {batch['hung']}")
+
+    startup = report['startup'] = benchmark_startup(max(repeat, 5))
+    print(f"* Startup: import {startup['import']:.3f}s, --help {startup['help']:.3f}s, "
+          f"interpreter {startup['interpreter']:.3f}s, target met: {startup['meets_target']}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the conversion on synthetic survey data.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='Numbers of responses to benchmark')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic data generator')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per size, the fastest time of each stage is kept')
+    parser.add_argument('--output', type=str, default='benchmark_results.json', help='Path to the JSON results file')
+
+    args = parser.parse_args()
+    report = run_benchmarks(args.sizes, args.seed, args.repeat)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"* Results saved to {args.output}")
@@ -3,15 +3,25 @@ import re
 import json
 import os
 import sys
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-import pandas as pd
+import csv
+import glob
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pickle
-import openpyxl
-from openpyxl.styles import PatternFill, Border, Side
+import gzip
+import time
+import heapq
+import tempfile
+import random
+from array import array
 from datetime import datetime
+from collections import namedtuple
+from functools import lru_cache, wraps
+from contextlib import contextmanager
+import tracemalloc
+import cProfile
+from copy import copy
 
 # Ensure UTF-8 encoding for console output
 sys.stdout.reconfigure(encoding='utf-8')
@@ -20,6 +30,205 @@ sys.stdout.reconfigure(encoding='utf-8')
 YES = 'Có'
 NO = 'Không'
 OWNER = 'Chủ hộ'
+FILL_COLORS = ['DDFFFF', 'FFFFFF']  # Light blue and white
+
+# Local snapshot cache of fetched sheet values
+CACHE_DIR = '.gsheet_cache'
+CACHE_MAX_AGE_DAYS = 30
+CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+# Only the sheet properties needed to select and size the sheets
+SPREADSHEET_FIELDS = 'sheets(properties(sheetId,title,index,hidden,gridProperties(rowCount,columnCount)))'
+
+# Limits of a single values.batchGet request
+BATCH_GET_MAX_RANGES = 50
+BATCH_GET_MAX_CELLS = 2000000
+
+# Streaming mode: rows fetched per request and rows sorted in memory before spilling to disk
+STREAM_CHUNK_ROWS = 5000
+STREAM_SORT_RUN_ROWS = 50000
+
+# Fetch scheduler: Sheets API read requests per minute, burst size, retries of throttled
+# (429) and server (5xx) errors with exponential backoff and jitter, socket timeout in seconds
+FETCH_RATE_PER_MINUTE = 60
+FETCH_BURST = 10
+FETCH_MAX_RETRIES = 5
+FETCH_BACKOFF_BASE = 1.0
+FETCH_BACKOFF_MAX = 64.0
+FETCH_TIMEOUT = 120
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Sheet name of the workbook consolidating several sources
+CONSOLIDATED_SHEET_NAME = 'Consolidated'
+
+class Profiler:
+    """
+    Record wall time, row counts, API usage and peak memory of every stage of a conversion.
+    Activate it with set_profiler(); the stages are collected in the order they finish.
+    Only the thread that created the profiler is recorded, the stages of worker threads
+    (e.g. the local reads of batch mode) would break the nesting of the stages.
+    """
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.stages = []
+        self._stack = []
+        self._thread = threading.get_ident()
+
+    def start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stop(self):
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name):
+        if threading.get_ident() != self._thread:
+            yield None
+            return
+        if self.trace_memory and tracemalloc.is_tracing():
+            # Keep the peak reached so far by the enclosing stage before resetting it
+            if self._stack:
+                self._stack[-1]['peak_memory_bytes'] = max(self._stack[-1]['peak_memory_bytes'], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        stats = {'name': name, 'parent': self._stack[-1]['name'] if self._stack else None, 'peak_memory_bytes': 0}
+        self._stack.append(stats)
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            stats['wall_time'] = round(time.perf_counter() - start, 6)
+            self._stack.pop()
+            if self.trace_memory and tracemalloc.is_tracing():
+                stats['peak_memory_bytes'] = max(stats['peak_memory_bytes'], tracemalloc.get_traced_memory()[1])
+                if self._stack:
+                    self._stack[-1]['peak_memory_bytes'] = max(self._stack[-1]['peak_memory_bytes'], stats['peak_memory_bytes'])
+            if stats.get('rows_in') and stats['wall_time']:
+                stats['rows_per_sec'] = round(stats['rows_in'] / stats['wall_time'], 1)
+            self.stages.append(stats)
+
+    def record(self, **counters):
+        """
+        Add counters to the current stage.
+        """
+        if self._stack and threading.get_ident() == self._thread:
+            stats = self._stack[-1]
+            for key, value in counters.items():
+                stats[key] = stats.get(key, 0) + value
+
+    def report(self):
+        """
+        Get the JSON-serializable report of the recorded stages.
+        """
+        totals = {}
+        for key in ('api_calls', 'api_retries', 'bytes_fetched'):
+            totals[key] = sum(stats.get(key, 0) for stats in self.stages)
+        return {'stages': self.stages, 'totals': totals}
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+
+
+# The active profiler, None when profiling is off
+PROFILER = None
+
+
+def set_profiler(profiler):
+    """
+    Activate a Profiler for the following conversions, or deactivate profiling with None.
+    Profiling covers the current process only, not the worker processes of batch mode.
+    """
+    global PROFILER
+    if PROFILER is not None:
+        PROFILER.stop()
+    PROFILER = profiler
+    if profiler is not None:
+        profiler.start()
+
+
+@contextmanager
+def profile_stage(name):
+    """
+    Record a stage into the active profiler, if any.
+    """
+    if PROFILER is None:
+        yield None
+    else:
+        with PROFILER.stage(name) as stats:
+            yield stats
+
+
+def profile_record(**counters):
+    """
+    Add counters to the current stage of the active profiler, if any.
+    """
+    if PROFILER is not None:
+        PROFILER.record(**counters)
+
+
+def profiled(name):
+    """
+    Decorator recording every call of a function as a stage of the active profiler.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with profile_stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def execute_request(request, http=None):
+    """
+    Execute an API request, counting the calls and response bytes for the profiler.
+
+    :param http: The HTTP connection to use instead of the one of the service.
+    """
+    result = request.execute() if http is None else request.execute(http=http)
+    if PROFILER is not None:
+        PROFILER.record(api_calls=1, bytes_fetched=response_size(result))
+    return result
+
+
+def response_size(result):
+    """
+    Get the size in bytes of an API response as JSON.
+    """
+    return len(json.dumps(result, ensure_ascii=False).encode('utf-8'))
+
+
+# Precompiled regexes of the normalizers
+NON_DIGIT_RE = re.compile(r'\D')
+NUMBER_RE = re.compile(r'\d+')
+# Fast path of the default date formats; anything else falls back to strptime
+DATE_RE = re.compile(r'(\d{1,2})/(\d{1,2})/(\d{4})')
+DATETIME_RE = re.compile(r'(\d{1,2})/(\d{1,2})/(\d{4}) (\d{1,2}):(\d{2}):(\d{2})')
+
+# Size of the caches of the normalizers of repetitive values (blocks, floors, homes, relationships...)
+NORMALIZE_CACHE_SIZE = 65536
+
+
+def parse_datetime(text, format):
+    """
+    Parse a date string like datetime.strptime, with a fast path for the default formats.
+    """
+    match = None
+    if format == '%m/%d/%Y %H:%M:%S':
+        match = DATETIME_RE.fullmatch(text)
+    elif format == '%m/%d/%Y':
+        match = DATE_RE.fullmatch(text)
+    if match:
+        parts = [int(part) for part in match.groups()]
+        try:
+            return datetime(parts[2], parts[0], parts[1], *parts[3:])
+        except ValueError:
+            pass  # let strptime raise its own error
+    return datetime.strptime(text, format)
+
 
 def string_to_timestamp(date_string, format='%m/%d/%Y %H:%M:%S'):
     """
@@ -29,10 +238,18 @@ def string_to_timestamp(date_string, format='%m/%d/%Y %H:%M:%S'):
     :param format: The format of the date string.
     :return: A datetime object representing the timestamp.
     """
-    date = datetime.strptime(date_string, format)
+    date = parse_datetime(date_string, format)
     return date.timestamp()
 
 
+def string_to_timestamps(date_strings, format='%m/%d/%Y %H:%M:%S'):
+    """
+    Convert a column of date strings to integer timestamps (whole seconds) in a compact array.
+    """
+    return array('q', [int(string_to_timestamp(date_string, format)) for date_string in date_strings])
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
 def normalize_capitalize(text):
     """
     Capitalize the first letter of a string.
@@ -40,18 +257,20 @@ def normalize_capitalize(text):
     return ' '.join(word.capitalize() for word in text.split())
 
 
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
 def normalize_date(text, inputFormat='%m/%d/%Y', outputFormat='%d/%m/%Y'):
     """
     Normalize a date string to the output format.
     """
-    date = datetime.strptime(text, inputFormat)
+    date = parse_datetime(text, inputFormat)
     return date.strftime(outputFormat)
 
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
 def normalize_phone_number(text):
     """
     Normalize a phone number from any text format to the output format 0xxx.xxx.xxx
     """
-    digits = re.sub(r'\D', '', text)  # Remove all non-digit characters
+    digits = NON_DIGIT_RE.sub('', text)  # Remove all non-digit characters
     if len(digits) == 10 and digits.startswith('0'):
         return f'{digits[:4]}.{digits[4:7]}.{digits[7:]}'
     return text  # Return the original text if it doesn't match the expected format
@@ -67,13 +286,172 @@ def excel_col_to_index(col_str):
         result = result * 26 + (ord(char.upper()) - ord('A') + 1)
     return result - 1
 
-def process_sheet_data(values, column_mapping):
+
+def index_to_excel_col(index):
+    """
+    Convert a 1-based column index to Excel column letters.
+    For example: 1 -> A, 26 -> Z, 27 -> AA, etc.
+    """
+    letters = ''
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+ColumnPlan = namedtuple('ColumnPlan', [
+    'timestamp_idx', 'block_idx', 'floor_idx', 'home_idx',
+    'common_idx', 'owner_idx', 'owner_next_idx',
+    'member_idx', 'member_next_idx', 'member_stride',
+    'output_columns', 'additional_count',
+    'normalize_name_idx', 'normalize_birthday_idx', 'normalize_phone_idx', 'normalize_relationship_idx',
+    'merge_col_idx', 'group_by_col_idx', 'integer_col_idx', 'categorical_col_idx',
+])
+
+
+def compile_column_mapping(column_mapping):
+    """
+    Compile the column_mapping dict once into an immutable ColumnPlan with 0-based
+    source indices, the member block stride and the output schema.
+    Raise ValueError if the mapping is inconsistent.
+    """
+    if isinstance(column_mapping, ColumnPlan):
+        return column_mapping
+
+    common_idx = tuple(excel_col_to_index(col) for col in column_mapping['src_common_info_id'])
+    owner_idx = tuple(excel_col_to_index(col) for col in column_mapping['src_owner_info_id'])
+    member_idx = tuple(excel_col_to_index(col) for col in column_mapping['src_member_info_id'])
+
+    if len(common_idx) < 4:
+        raise ValueError("src_common_info_id must contain at least Timestamp, Block, Floor and Home columns")
+    if len(common_idx) - 1 != len(column_mapping['dest_common_info_names']):
+        raise ValueError("dest_common_info_names does not match src_common_info_id (Floor and Home are merged)")
+
+    member_width = len(column_mapping['dest_member_info_names'])
+    if len(owner_idx) + 1 != member_width:
+        raise ValueError("dest_member_info_names does not match src_owner_info_id + owner relationship")
+    if len(member_idx) != member_width:
+        raise ValueError("dest_member_info_names does not match src_member_info_id")
+    if len(member_idx) < 2:
+        raise ValueError("src_member_info_id must contain at least 2 columns")
+
+    for key in ('normalize_name_idx', 'normalize_birthday_idx', 'normalize_phone_idx', 'normalize_relationship_idx'):
+        if not 0 <= column_mapping[key] < member_width:
+            raise ValueError(f"{key} is out of range 0..{member_width - 1}")
+
+    output_columns = tuple(column_mapping['dest_common_info_names'] + column_mapping['dest_member_info_names'] + column_mapping['dest_additional_info_names'])
+    if len(set(output_columns)) != len(output_columns):
+        raise ValueError("Destination column names must be unique")
+
+    # Low-cardinality columns stored as categoricals, STT and G-Row ID are always integers
+    categorical_names = column_mapping.get('dest_categorical_names', [])
+    unknown = [name for name in categorical_names if name not in output_columns]
+    if unknown:
+        raise ValueError(f"dest_categorical_names contains unknown columns: {', '.join(unknown)}")
+    integer_col_idx = (0, len(output_columns) - 1)
+    categorical_col_idx = tuple(output_columns.index(name) for name in categorical_names
+                                if output_columns.index(name) not in integer_col_idx)
+
+    return ColumnPlan(
+        timestamp_idx=common_idx[0],
+        block_idx=common_idx[1],
+        floor_idx=common_idx[2],
+        home_idx=common_idx[3],
+        common_idx=common_idx,
+        owner_idx=owner_idx,
+        owner_next_idx=excel_col_to_index(column_mapping['src_owner_info_next_id']),
+        member_idx=member_idx,
+        member_next_idx=excel_col_to_index(column_mapping['src_member_info_next_id']),
+        member_stride=len(member_idx) + 1,
+        output_columns=output_columns,
+        additional_count=len(column_mapping['dest_additional_info_ids']),
+        normalize_name_idx=column_mapping['normalize_name_idx'],
+        normalize_birthday_idx=column_mapping['normalize_birthday_idx'],
+        normalize_phone_idx=column_mapping['normalize_phone_idx'],
+        normalize_relationship_idx=column_mapping['normalize_relationship_idx'],
+        merge_col_idx=tuple(excel_col_to_index(col) + 1 for col in column_mapping['dest_merge_cells_ids']),
+        group_by_col_idx=excel_col_to_index(column_mapping['dest_group_by_id']) + 1,
+        integer_col_idx=integer_col_idx,
+        categorical_col_idx=categorical_col_idx,
+    )
+
+
+class OutputColumns:
+    """
+    Accumulate output rows column by column in a compact form: the integer columns
+    in typed arrays, the categorical columns as codes into their distinct values
+    and the other columns as plain lists.
+    """
+
+    def __init__(self, plan):
+        self.names = list(plan.output_columns)
+        self.columns = [[] for _ in self.names]
+        self.categories = {}
+        for i in plan.integer_col_idx:
+            self.columns[i] = array('q')
+        for i in plan.categorical_col_idx:
+            self.columns[i] = array('i')
+            self.categories[i] = {}
+        self.categorical = sorted(self.categories.items())
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def append(self, row_data):
+        """
+        Append one output row, encoding the categorical values.
+        """
+        row_data = list(row_data)
+        for i, codes in self.categorical:
+            value = row_data[i]
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(codes)
+            row_data[i] = code
+        for column, value in zip(self.columns, row_data):
+            column.append(value)
+
+    def extend(self, columns):
+        """
+        Append whole output columns, encoding the categorical values.
+        """
+        for i, column in enumerate(columns):
+            if i in self.categories:
+                codes = self.categories[i]
+                column = [codes[value] if value in codes else codes.setdefault(value, len(codes)) for value in column]
+            self.columns[i].extend(column)
+
+    def to_frame(self):
+        """
+        Build the DataFrame without expanding the compact columns back into Python objects.
+        """
+        import numpy as np
+        import pandas as pd
+
+        data = {}
+        for i, (name, column) in enumerate(zip(self.names, self.columns)):
+            if i in self.categories:
+                categories = pd.Index(list(self.categories[i]), dtype='str')
+                data[name] = pd.Categorical.from_codes(np.frombuffer(column, dtype=np.dtype(column.typecode)), categories)
+            elif isinstance(column, array):
+                data[name] = np.frombuffer(column, dtype=np.int64)
+            else:
+                data[name] = column
+        return pd.DataFrame(data, columns=self.names)
+
+
+@profiled('process_sheet_data')
+def process_sheet_data(values, column_mapping, duplicates_report=None):
     """
     Process sheet data into a pandas DataFrame with proper column mapping
+
+    :param duplicates_report: A list extended with the superseded responses, see dedup_latest_responses.
     """
     if not values:
         return None
 
+    plan = compile_column_mapping(column_mapping)
+
     # Get the maximum number of columns in any row
     max_cols = max(len(row) for row in values)
     
@@ -90,119 +468,422 @@ def process_sheet_data(values, column_mapping):
         padded_row.append(idx)
         padded_values.append(padded_row)
 
-    # sort the rows by the block, floor, home accending and timestamp descending
-    blockCol = excel_col_to_index('B')
-    floorCol = excel_col_to_index('C')
-    homeCol = excel_col_to_index('D')
-    timestampCol = excel_col_to_index('A')
-    padded_values.sort(key=lambda x: (createHomeID(x[blockCol], x[floorCol], x[homeCol]), -(string_to_timestamp(x[timestampCol]))), reverse=False)
-
-    # warning if dupplicate block, floor, home
-    dupplicateRows = []
-    originalRow = -1
-    for i in range(1, len(padded_values)):
-        block = padded_values[i][blockCol]
-        floor = padded_values[i][floorCol]
-        home = padded_values[i][homeCol]
-        row = padded_values[i][-1]
-        if block == padded_values[i-1][blockCol] and floor == padded_values[i-1][floorCol] and home == padded_values[i-1][homeCol]:
-            # set original row
-            if  originalRow == -1:
-                originalRow = padded_values[i-1][-1]
-            print(f"* Warning: Dupplicate {createHomeID(block, floor, home)} at row {row + 1} vs lastest {originalRow + 1}")
-            dupplicateRows.append(i)
-        else:
-            # reset original row
-            originalRow = -1
+    profile_record(rows_in=len(padded_values))
+
+    # columns of the HomeID and the timestamp
+    blockCol = plan.block_idx
+    floorCol = plan.floor_idx
+    homeCol = plan.home_idx
+    timestampCol = plan.timestamp_idx
+    with profile_stage('dedup_sort'):
+        profile_record(rows_in=len(padded_values))
+        # compute the HomeID and timestamp columns once for the dedup and the sort
+        home_ids = create_home_ids([x[blockCol] for x in padded_values], [x[floorCol] for x in padded_values], [x[homeCol] for x in padded_values])
+        timestamps = string_to_timestamps([x[timestampCol] for x in padded_values])
+
+        # keep the latest response of every HomeID
+        kept, duplicates = dedup_latest_responses(array('q', [x[-1] for x in padded_values]), home_ids, timestamps)
+        for duplicate in duplicates:
+            print(f"* Warning: Dupplicate {duplicate['home_id']} at row {duplicate['row']} vs lastest {duplicate['latest_row']}")
+        if duplicates_report is not None:
+            duplicates_report.extend(duplicates)
+
+        # sort the rows by the block, floor, home accending
+        kept.sort(key=lambda i: home_ids[i])
+        padded_values = [padded_values[i] for i in kept]
+        profile_record(rows_out=len(padded_values), duplicates_dropped=len(duplicates))
+
+    # Accumulate the output column by column and build a single DataFrame at the end
+    output_columns = OutputColumns(plan)
+
+    with profile_stage('normalize_expand'):
+        profile_record(rows_in=len(padded_values))
+        member_rows = 0
+        if padded_values:
+            # Expand every household at once, STT is the index of the sorted row
+            positions, columns, errors = expand_households(padded_values, plan)
+            for idx, e in errors:
+                print(f"* Error processing row {idx}: {str(e)}")
+            output_columns.extend(columns)
+            member_rows = len(positions) - len(set(positions))
+        profile_record(rows_out=len(output_columns), member_rows=member_rows)
+
+    # The input rows are no longer needed once the output columns are built
+    del padded_values
+    profile_record(rows_out=len(output_columns))
+    if not len(output_columns):
+        return None
+
+    with profile_stage('build_dataframe'):
+        return output_columns.to_frame()
+
+
+def dedup_latest_responses(row_ids, home_ids, timestamps):
+    """
+    Keep the latest response of every HomeID in a single pass.
+    On equal timestamps the earliest submitted response is kept.
+
+    :param row_ids: The original 1-based data row index of every response.
+    :return: A tuple (indexes of the kept responses, duplicates report) where the report
+             lists the superseded responses as dicts with home_id, row and latest_row
+             (sheet row numbers), sorted by HomeID and latest timestamp first.
+    """
+    latest = {}
+    for i, home_id in enumerate(home_ids):
+        j = latest.get(home_id)
+        if j is None or timestamps[i] > timestamps[j]:
+            latest[home_id] = i
+
+    kept = list(latest.values())
+    kept_set = set(kept)
+    superseded = sorted((i for i in range(len(home_ids)) if i not in kept_set), key=lambda i: (home_ids[i], -timestamps[i], i))
+    duplicates = [{
+        'home_id': home_ids[i],
+        'row': row_ids[i] + 1,
+        'latest_row': row_ids[latest[home_ids[i]]] + 1,
+    } for i in superseded]
+    return kept, duplicates
+
+
+def iter_household_rows(row, plan):
+    """
+    Yield the output rows of a household response: the owner row first, then one row per member.
+    The first element (STT) is left for the caller to number.
+    """
+    # Extract common info using the correct column indices
+    common_info = [row[col_idx] if col_idx < len(row) else '' for col_idx in plan.common_idx]
+
+    # Merge floor and home into a single column
+    block = common_info[1]
+    floor = common_info[2]
+    home = common_info[3]
+    common_info[2] = createHomeID(block, floor, home)
+    common_info.pop(3)
+    
+    # Extract owner info using the correct column indices
+    owner_info = [row[col_idx] if col_idx < len(row) else '' for col_idx in plan.owner_idx]
+    # Append the last element with 'Owner'
+    owner_info.append(normalize_capitalize(OWNER))
+    # capitalize the first letter of the full name
+    owner_info[plan.normalize_name_idx] = normalize_capitalize(owner_info[plan.normalize_name_idx])
+    # normalize the date format
+    owner_info[plan.normalize_birthday_idx] = normalize_date(owner_info[plan.normalize_birthday_idx])
+    # normalize the phone number
+    owner_info[plan.normalize_phone_idx] = normalize_phone_number(owner_info[plan.normalize_phone_idx])
+
+    # G-Row ID
+    additional_info_data = [''] * plan.additional_count
+    additional_info_data[-1] = row[-1] + 1
+
+    # Add the owner row
+    yield common_info + owner_info + additional_info_data
+
+    # Extract member info using the correct column indices
+    hasMember = row[plan.owner_next_idx] == YES
+    if hasMember:
+        members_info = process_member_data(row, plan)
+
+        for member_info in members_info:
+            yield common_info + member_info + additional_info_data
+
+
+@profiled('process_sheet_data_incremental')
+def process_sheet_data_incremental(values, column_mapping, state=None, duplicates_report=None):
+    """
+    Process only the responses added since the previous run and apply them to
+    the households kept in the state, replacing a household when a newer
+    response for it arrives.
+
+    :param state: The state returned by the previous run, or None for a full run.
+    :param duplicates_report: A list extended with the superseded responses, see dedup_latest_responses.
+    :return: A tuple (DataFrame or None, new state).
+    """
+    plan = compile_column_mapping(column_mapping)
+    if not values:
+        return None, state
+
+    # Rows are padded to the widest row, so a wider sheet changes earlier results
+    max_cols = max(len(row) for row in values)
+    if state is not None and (state['max_cols'] != max_cols or state['row_count'] > len(values) - 1):
+        print("* Warning: Sheet layout changed since the last export, processing all rows")
+        state = None
+    if state is None:
+        state = {'max_cols': max_cols, 'row_count': 0, 'last_timestamp': None, 'last_g_row_id': None, 'households': []}
+
+    households = {h['home_id']: h for h in state['households']}
+    row_count = state['row_count']
+
+    # Keep the latest response of every household among the new rows
+    changed = {}
+    for idx, row in enumerate(values[row_count + 1:], start=row_count + 1):
+        padded_row = row + [''] * (max_cols - len(row)) if len(row) < max_cols else row
+        # append original row index into the last column
+        padded_row.append(idx)
+
+        key = createHomeID(padded_row[plan.block_idx], padded_row[plan.floor_idx], padded_row[plan.home_idx])
+        timestamp = string_to_timestamp(padded_row[plan.timestamp_idx])
+        current = households.get(key)
+        if current is not None:
+            if timestamp <= current['timestamp']:
+                duplicate = {'home_id': key, 'row': idx + 1, 'latest_row': current['g_row_id']}
+            else:
+                duplicate = {'home_id': key, 'row': current['g_row_id'], 'latest_row': idx + 1}
+            print(f"* Warning: Dupplicate {key} at row {duplicate['row']} vs lastest {duplicate['latest_row']}")
+            if duplicates_report is not None:
+                duplicates_report.append(duplicate)
+            if timestamp <= current['timestamp']:
+                continue
+
+        households[key] = {
+            'home_id': key,
+            'timestamp': timestamp,
+            'g_row_id': idx + 1,
+            'rows': None,
+        }
+        changed[key] = padded_row
+
+    # Normalize only the new or replaced households
+    keys = list(changed)
+    for key in keys:
+        households[key]['rows'] = []
+    if keys:
+        rows = [changed[key] for key in keys]
+        positions, columns, errors = expand_households(rows, plan)
+        for position, e in errors:
+            print(f"* Error processing row {rows[position][-1]}: {str(e)}")
+        for position, row_data in zip(positions, zip(*columns)):
+            households[keys[position]]['rows'].append(list(row_data))
+
+    ordered = sorted(households.values(), key=lambda h: h['home_id'])
+    print(f"* Incremental: {len(values) - 1 - row_count} new row(s), {len(changed)} household(s) updated")
+
+    output_columns = OutputColumns(plan)
+    for idx, household in enumerate(ordered, start=0):
+        for row_data in household['rows']:
+            row_data = list(row_data)
+            row_data[0] = idx + 1
+            output_columns.append(row_data)
+
+    state = {
+        'max_cols': max_cols,
+        'row_count': len(values) - 1,
+        'last_timestamp': max((h['timestamp'] for h in ordered), default=None),
+        'last_g_row_id': len(values),
+        'households': ordered,
+    }
+
+    if not len(output_columns):
+        return None, state
 
-    # remove dupplicate rows
-    for i in range(len(dupplicateRows)-1, -1, -1):
-        padded_values.pop(dupplicateRows[i])
+    return output_columns.to_frame(), state
 
-    # Process each row into a DataFrame
-    split_dfs = []
-    additional_info_data = [''] * len(column_mapping['dest_additional_info_ids'])
 
-    for idx, row in enumerate(padded_values, start=0):
+def incremental_state_path(output_path):
+    """
+    Get the path of the incremental state file next to the output file.
+    """
+    return os.path.splitext(output_path)[0] + '.state.json'
+
+
+def load_incremental_state(output_path):
+    """
+    Load the incremental state saved by the previous export, or an empty state.
+    """
+    state_path = incremental_state_path(output_path)
+    if not os.path.exists(state_path):
+        return {'sheets': {}}
+    with open(state_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_incremental_state(output_path, state):
+    """
+    Save the incremental state next to the output file.
+    """
+    state_path = incremental_state_path(output_path)
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, state_path)
+
+
+def _cell(row, col_idx):
+    return row[col_idx] if col_idx < len(row) else ''
+
+
+def _write_run(items, tmp_dir):
+    """
+    Spill a sorted run of (key, row) items to a temporary JSON lines file.
+    """
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=tmp_dir, suffix='.run', delete=False) as f:
+        for key, row in items:
+            f.write(json.dumps([key, row], ensure_ascii=False, separators=(',', ':')))
+            f.write('\n')
+        return f.name
+
+
+def _read_run(path):
+    """
+    Read back a run written by _write_run.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            key, row = json.loads(line)
+            yield tuple(key), row
+
+
+def external_sort_rows(rows, plan, tmp_dir, run_rows=STREAM_SORT_RUN_ROWS):
+    """
+    Sort the response rows by HomeID ascending and timestamp descending without holding
+    more than run_rows rows in memory: sorted runs are spilled to tmp_dir and merged lazily.
+
+    :param rows: An iterator over the data rows (without the header).
+    :return: A tuple (max_cols, iterator of (key, row) in sorted order).
+             The key ends with the original row index.
+    """
+    max_cols = 0
+    runs = []
+    buffer = []
+    sort_key = lambda item: item[0]
+    for idx, row in enumerate(rows, start=1):
+        max_cols = max(max_cols, len(row))
+        key = (createHomeID(_cell(row, plan.block_idx), _cell(row, plan.floor_idx), _cell(row, plan.home_idx)),
+               -string_to_timestamp(_cell(row, plan.timestamp_idx)), idx)
+        buffer.append((key, row))
+        if len(buffer) >= run_rows:
+            buffer.sort(key=sort_key)
+            runs.append(_read_run(_write_run(buffer, tmp_dir)))
+            buffer = []
+
+    buffer.sort(key=sort_key)
+    runs.append(iter(buffer))
+    return max_cols, heapq.merge(*runs, key=sort_key)
+
+
+def latest_sorted_responses(rows, plan, tmp_dir, run_rows=STREAM_SORT_RUN_ROWS, duplicates_report=None):
+    """
+    Stream the latest response of every HomeID of a sheet in HomeID order, using an external sort.
+
+    :param rows: An iterator over the sheet rows, header first.
+    :param duplicates_report: A list extended with the superseded responses, see dedup_latest_responses.
+    :return: A generator of (key, padded row) with the original row index appended to the row.
+    """
+    rows = iter(rows)
+    headers = next(rows, None)
+    if headers is None:
+        return
+
+    max_cols, sorted_items = external_sort_rows(rows, plan, tmp_dir, run_rows)
+    max_cols = max(max_cols, len(headers))
+
+    # the first response of every HomeID is the latest one
+    previous_home_id = None
+    latest_row = -1
+    for key, row in sorted_items:
+        if key[0] == previous_home_id:
+            print(f"* Warning: Dupplicate {key[0]} at row {key[-1] + 1} vs lastest {latest_row + 1}")
+            if duplicates_report is not None:
+                duplicates_report.append({'home_id': key[0], 'row': key[-1] + 1, 'latest_row': latest_row + 1})
+            continue
+        previous_home_id = key[0]
+        latest_row = key[-1]
+
+        padded_row = row + [''] * (max_cols - len(row)) if len(row) < max_cols else row
+        # append original row index into the last column
+        padded_row.append(key[-1])
+        yield key, padded_row
+
+
+def expand_sorted_responses(items, plan):
+    """
+    Stream the output rows of sorted (key, padded row) responses, numbering the households.
+    """
+    idx = 0
+    for _, row in items:
+        output_rows = []
         try:
-            # Extract common info using the correct column indices
-            common_info = []
-            for col in column_mapping['src_common_info_id']:
-                col_idx = excel_col_to_index(col)
-                common_info.append(row[col_idx] if col_idx < len(row) else '')
-
-            # Merge floor and home into a single column
-            block = common_info[1]
-            floor = common_info[2]
-            home = common_info[3]
-            common_info[2] = createHomeID(block, floor, home)
-            common_info.pop(3)
-            
-            # Replace the first element with the row index
-            common_info[0] = idx + 1
-            
-            # Extract owner info using the correct column indices
-            owner_info = []
-            for col in column_mapping['src_owner_info_id']:
-                col_idx = excel_col_to_index(col)
-                owner_info.append(row[col_idx] if col_idx < len(row) else '')
-            # Append the last element with 'Owner'
-            owner_info.append(normalize_capitalize(OWNER))
-            # capitalize the first letter of the full name
-            owner_info[column_mapping['normalize_name_idx']] = normalize_capitalize(owner_info[column_mapping['normalize_name_idx']])
-            # normalize the date format
-            owner_info[column_mapping['normalize_birthday_idx']] = normalize_date(owner_info[column_mapping['normalize_birthday_idx']])
-            # normalize the phone number
-            owner_info[column_mapping['normalize_phone_idx']] = normalize_phone_number(owner_info[column_mapping['normalize_phone_idx']])
-
-            # G-Row ID
-            additional_info_data[-1] = row[-1] + 1
-
-            # Create DataFrame for the row
-            row_data = [common_info + owner_info + additional_info_data]
-            row_columns = column_mapping['dest_common_info_names'] + column_mapping['dest_member_info_names'] + column_mapping['dest_additional_info_names']
-            row_df = pd.DataFrame(row_data, columns=row_columns)
-            split_dfs.append(row_df)
-
-            # Extract member info using the correct column indices
-            hasMember = row[excel_col_to_index(column_mapping['src_owner_info_next_id'])] == YES
-            if hasMember:
-                member_mapping = {
-                    'src_member_info_next_id': column_mapping['src_member_info_next_id'],
-                    'src_member_info_names': column_mapping['src_member_info_names'],
-                    'src_member_info_id': column_mapping['src_member_info_id'],
-                    'dest_member_info_ids': column_mapping['dest_member_info_ids'],
-                    'dest_member_info_names': column_mapping['dest_member_info_names']
-                }
-                members_info = process_member_data(row, member_mapping)
-
-                for member_info in members_info:
-                    row_member_data = [common_info + member_info + additional_info_data]
-                    row_member_columns = column_mapping['dest_common_info_names'] + column_mapping['dest_member_info_names'] + column_mapping['dest_additional_info_names']
-                    row_member_df = pd.DataFrame(row_member_data, columns=row_member_columns)
-                    split_dfs.append(row_member_df)
-            
+            for row_data in iter_household_rows(row, plan):
+                # Replace the first element with the row index
+                row_data[0] = idx + 1
+                output_rows.append(row_data)
         except Exception as e:
             print(f"* Error processing row {idx}: {str(e)}")
-            continue
+        idx += 1
+        yield from output_rows
+
+
+def stream_sheet_data(rows, column_mapping, tmp_dir=None, run_rows=STREAM_SORT_RUN_ROWS, duplicates_report=None):
+    """
+    Stream the output rows of a sheet, like process_sheet_data but without building
+    the whole sheet in memory. Sorting and duplicate removal use an external sort.
+
+    :param rows: An iterator over the sheet rows, header first.
+    :param duplicates_report: A list extended with the superseded responses, see dedup_latest_responses.
+    :return: A generator of output rows.
+    """
+    plan = compile_column_mapping(column_mapping)
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as run_dir:
+        yield from expand_sorted_responses(latest_sorted_responses(rows, plan, run_dir, run_rows, duplicates_report), plan)
 
-    if not split_dfs:
-        return None
 
-    return pd.concat(split_dfs, ignore_index=True)
+def stream_consolidated_data(sources, column_mapping, tmp_dir=None, run_rows=STREAM_SORT_RUN_ROWS, duplicates_report=None):
+    """
+    Stream the output rows of several sources merged into one HomeID-sorted result.
+    Every source is sorted and deduplicated on its own and spilled to disk, then the
+    sources are combined by a k-way merge holding one row per source in memory.
+    A HomeID found in several sources keeps the latest response, the first source
+    on equal timestamps.
+
+    :param sources: An iterable of (source_name, iterator of rows header first), opened one at a time.
+    :param duplicates_report: A dict filled with source name -> superseded responses of the source, see
+                              dedup_latest_responses; those superseded by another source have a latest_source.
+                              It is complete once the generator is exhausted.
+    :return: A generator of output rows with continuous STT numbering.
+    """
+    plan = compile_column_mapping(column_mapping)
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as run_dir:
+        names = []
+        runs = []
+        for source_idx, (source_name, rows) in enumerate(sources):
+            print(f"* Sorting source: {source_name}")
+            names.append(source_name)
+            duplicates = None if duplicates_report is None else duplicates_report.setdefault(source_name, [])
+            # the source index goes before the row index in the key, so equal timestamps keep the first source
+            items = (((key[0], key[1], source_idx, key[-1]), row)
+                     for key, row in latest_sorted_responses(rows, plan, run_dir, run_rows, duplicates))
+            runs.append(_read_run(_write_run(items, run_dir)))
+
+        def latest_across_sources():
+            previous_home_id = None
+            latest = None
+            for key, row in heapq.merge(*runs, key=lambda item: item[0]):
+                if key[0] == previous_home_id:
+                    print(f"* Warning: Dupplicate {key[0]} in {names[key[2]]} at row {key[-1] + 1} "
+                          f"vs lastest in {names[latest[2]]} at row {latest[-1] + 1}")
+                    if duplicates_report is not None:
+                        duplicates_report[names[key[2]]].append({'home_id': key[0], 'row': key[-1] + 1,
+                                                                 'latest_source': names[latest[2]], 'latest_row': latest[-1] + 1})
+                    continue
+                previous_home_id = key[0]
+                latest = key
+                yield key, row
+
+        yield from expand_sorted_responses(latest_across_sources(), plan)
 
 
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
 def regex_extract_number(text):
     """
     Extract the number from a string using regex and pad it with leading zeros to length 2.
     """
-    match = re.search(r'\d+', text)
+    match = NUMBER_RE.search(text)
     if match:
         number = match.group(0)
         return number.zfill(2)  # Pad the number with leading zeros to ensure length is 2
     return '00'  # Return '00' if no number is found
 
 
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
 def createHomeID(block, floor, home):
     """
     Create a HomeID from the block, floor, and home
@@ -221,56 +902,197 @@ def createHomeID(block, floor, home):
     return f'{block}-{regex_extract_number(floor)}{regex_extract_number(home)}'
 
 
-def process_member_data(row, member_mapping):
+def create_home_ids(blocks, floors, homes):
+    """
+    Create the HomeIDs of whole block, floor and home columns.
+    """
+    return [createHomeID(block, floor, home) for block, floor, home in zip(blocks, floors, homes)]
+
+
+def process_member_data(row, plan):
     """
     Process member data into a list of rows for the member DataFrame
     """
     member_info = []
-    member_info_next_id = member_mapping['src_member_info_next_id']
-    member_info_names = member_mapping['src_member_info_names']
-    member_info_ids = member_mapping['src_member_info_id']
-    member_info_next_col = excel_col_to_index(member_info_next_id)
-    member_info_columns = member_mapping['dest_member_info_names']
+    member_info_ids = plan.member_idx
+    member_info_next_col = plan.member_next_idx
+    member_stride = plan.member_stride
+    name_idx = plan.normalize_name_idx
+    birthday_idx = plan.normalize_birthday_idx
+    relationship_idx = plan.normalize_relationship_idx
+    phone_idx = plan.normalize_phone_idx
+    row_len = len(row)
     
     col_offset = 0
 
     while True:
-        member_data = []
-        
         # Extract member info using the correct column indices
-        for col in member_info_ids:
-            col_idx = excel_col_to_index(col) + col_offset
-            member_data.append(row[col_idx] if col_idx < len(row) else '')
+        member_data = [row[col_idx + col_offset] if col_idx + col_offset < row_len else '' for col_idx in member_info_ids]
         # swap the last two elements
         # because the last element is the phone number
         member_data[-1], member_data[-2] = member_data[-2], member_data[-1]
         # capitalize the first letter of the full name
-        member_data[column_mapping['normalize_name_idx']] = normalize_capitalize(member_data[column_mapping['normalize_name_idx']])
+        member_data[name_idx] = normalize_capitalize(member_data[name_idx])
         # normalize the date format
-        member_data[column_mapping['normalize_birthday_idx']] = normalize_date(member_data[column_mapping['normalize_birthday_idx']])
+        member_data[birthday_idx] = normalize_date(member_data[birthday_idx])
         # normalize the relationship
-        member_data[column_mapping['normalize_relationship_idx']] = normalize_capitalize(member_data[column_mapping['normalize_relationship_idx']])
+        member_data[relationship_idx] = normalize_capitalize(member_data[relationship_idx])
         # normalize the phone number
-        member_data[column_mapping['normalize_phone_idx']] = normalize_phone_number(member_data[column_mapping['normalize_phone_idx']])
+        member_data[phone_idx] = normalize_phone_number(member_data[phone_idx])
 
         # Append the member info to the list
         member_info.append(member_data)
         
         # Check if there are more members
-        if (member_info_next_col + col_offset) >= len(row) - 1 or row[member_info_next_col + col_offset] == NO:
+        if (member_info_next_col + col_offset) >= row_len - 1 or row[member_info_next_col + col_offset] == NO:
             break
 
         # Move to the next member
-        col_offset  += len(member_info_ids) + 1
+        col_offset  += member_stride
 
     return member_info
 
 
+def normalize_column(func, *columns):
+    """
+    Apply a normalizer to whole object array columns, calling it once per distinct value.
+
+    :return: A tuple (object array of normalized values, dict of position -> exception)
+             where a failed value is None.
+    """
+    import numpy as np
+    import pandas as pd
+
+    # Dense code of every distinct combination of values, in order of appearance
+    codes = None
+    for column in columns:
+        column_codes, uniques = pd.factorize(column, use_na_sentinel=False)
+        codes = column_codes if codes is None else pd.factorize(codes * len(uniques) + column_codes)[0]
+    _, first = np.unique(codes, return_index=True)
+
+    results = np.empty(len(first), dtype=object)
+    failed = {}
+    for code, key in enumerate(zip(*(column[first].tolist() for column in columns))):
+        try:
+            results[code] = func(*key)
+        except Exception as e:
+            failed[code] = e
+
+    errors = {}
+    if failed:
+        for position in np.nonzero(np.isin(codes, list(failed)))[0].tolist():
+            errors[position] = failed[codes[position]]
+    return results[codes], errors
+
+
+def expand_households(rows, plan):
+    """
+    Expand the padded responses of a whole sheet into output rows at once:
+    the repeating member column groups are reshaped into a long table, cut at
+    the first NO marker of every household, normalized column-wise and
+    interleaved with the owner rows, like iter_household_rows row by row.
+
+    :param rows: Padded rows of equal length with the original row index appended.
+    :return: A tuple (positions, columns, errors) where positions holds the index in rows of
+             every output row, columns the output columns with STT set to position + 1, and
+             errors the (position, exception) of the responses that failed, in row order.
+             A failed owner drops the household and a failed member drops all its members.
+    """
+    import numpy as np
+
+    n = len(rows)
+    width = len(rows[0]) - 1
+    # One extra empty column stands for the cells beyond the end of the rows
+    table = np.empty((n, width + 2), dtype=object)
+    table[:, :width + 1] = np.array(rows, dtype=object)
+    table[:, width + 1] = ''
+
+    def take(col_idx):
+        return table[:, col_idx if col_idx <= width else width + 1]
+
+    errors = {}
+
+    def normalized(func, values, errors_of, positions):
+        result, failed = normalize_column(func, *values)
+        for i, e in failed.items():
+            errors_of.setdefault(int(positions[i]), e)
+        return result
+
+    # Common info, with floor and home merged into a single column
+    common = [take(col_idx) for col_idx in plan.common_idx]
+    all_positions = np.arange(n)
+    common[2] = normalized(createHomeID, common[1:4], errors, all_positions)
+    common.pop(3)
+    common[0] = all_positions + 1
+
+    # Owner info, with the owner relationship appended
+    owner = [take(col_idx) for col_idx in plan.owner_idx]
+    owner.append(np.full(n, normalize_capitalize(OWNER), dtype=object))
+    for idx, func in ((plan.normalize_name_idx, normalize_capitalize),
+                      (plan.normalize_birthday_idx, normalize_date),
+                      (plan.normalize_phone_idx, normalize_phone_number)):
+        owner[idx] = normalized(func, [owner[idx]], errors, all_positions)
+
+    additional = [np.full(n, '', dtype=object) for _ in range(plan.additional_count)]
+    additional[-1] = table[:, width].astype(np.int64) + 1
+
+    # Number of members of every household: blocks continue until a NO marker or the end of the row
+    marker_cols = list(range(plan.member_next_idx, width, plan.member_stride))
+    block_count = len(marker_cols) + 1
+    more = np.ones((n, block_count), dtype=bool)
+    for k, col_idx in enumerate(marker_cols):
+        more[:, k + 1] = table[:, col_idx] != NO
+    member_counts = np.cumprod(more, axis=1).sum(axis=1)
+    member_counts[take(plan.owner_next_idx) != YES] = 0
+
+    # Long table of the members in household then block order
+    member_cols = [[col_idx + k * plan.member_stride for col_idx in plan.member_idx] for k in range(block_count)]
+    member_cols = np.array([[c if c <= width else width + 1 for c in cols] for cols in member_cols], dtype=np.intp)
+    in_household = np.arange(block_count) < member_counts[:, None]
+    member_positions, member_blocks = np.nonzero(in_household)
+    members = table[member_positions[:, None], member_cols[member_blocks]]
+    members = [members[:, j] for j in range(members.shape[1])]
+    # swap the last two fields because the last one is the phone number
+    members[-1], members[-2] = members[-2], members[-1]
+    member_errors = {}
+    for idx, func in ((plan.normalize_name_idx, normalize_capitalize),
+                      (plan.normalize_birthday_idx, normalize_date),
+                      (plan.normalize_relationship_idx, normalize_capitalize),
+                      (plan.normalize_phone_idx, normalize_phone_number)):
+        members[idx] = normalized(func, [members[idx]], member_errors, np.arange(len(member_positions)))
+
+    owner_ok = np.ones(n, dtype=bool)
+    owner_ok[list(errors)] = False
+    members_ok = owner_ok.copy()
+    # The first failed member of a household is reported, unless its owner failed
+    for member in sorted(member_errors):
+        position = int(member_positions[member])
+        if members_ok[position]:
+            members_ok[position] = False
+            errors[position] = member_errors[member]
+    kept_members = members_ok[member_positions]
+
+    # Interleave: owner row first, then the members in block order
+    positions = np.concatenate([all_positions[owner_ok], member_positions[kept_members]])
+    order = np.lexsort((np.concatenate([np.zeros(owner_ok.sum(), dtype=np.intp), member_blocks[kept_members] + 1]), positions))
+    member_households = member_positions[kept_members]
+    columns = []
+    for owner_column, member_column in zip(owner, members):
+        columns.append(np.concatenate([owner_column[owner_ok], member_column[kept_members]])[order])
+    shared = [np.concatenate([column[owner_ok], column[member_households]])[order] for column in common + additional]
+    columns = shared[:len(common)] + columns + shared[len(common):]
+    return positions[order].tolist(), [column.tolist() for column in columns], sorted(errors.items())
+
+
 def get_credentials():
     """
     Get cached credentials or create new ones if needed.
     """
-    SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from google.auth.transport.requests import Request
+
+    SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly',
+              'https://www.googleapis.com/auth/drive.metadata.readonly']
     creds = None
     token_path = 'token.pickle'
     
@@ -278,6 +1100,10 @@ def get_credentials():
         with open(token_path, 'rb') as token:
             creds = pickle.load(token)
     
+    # Tokens created before the Drive metadata scope was added must be re-authorized
+    if creds and not creds.has_scopes(SCOPES):
+        creds = None
+
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
             creds.refresh(Request())
@@ -292,177 +1118,1457 @@ def get_credentials():
     return creds
 
 
-def merge_cells_if_same(sheet, start_row, end_row, col):
+@lru_cache(maxsize=None)
+def discovery_document(api, version, cache_dir=CACHE_DIR):
+    """
+    Get the parsed discovery document of a Google API, parsed once per process.
+    The document bundled with googleapiclient is used when available, otherwise it is
+    downloaded once and kept in the cache directory.
+    """
+    from googleapiclient import discovery_cache
+    from googleapiclient.discovery import V2_DISCOVERY_URI
+    document = discovery_cache.get_static_doc(api, version)
+    if document is None:
+        path = os.path.join(cache_dir, f'discovery.{api}.{version}.json')
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                document = file.read()
+        else:
+            from urllib.request import urlopen
+            with urlopen(V2_DISCOVERY_URI.format(api=api, apiVersion=version)) as response:
+                document = response.read().decode('utf-8')
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(document)
+    return json.loads(document)
+
+
+def build_service(api, version, creds):
+    """
+    Build a Google API client from the cached discovery document, without any network request.
+    """
+    from googleapiclient.discovery import build_from_document
+    return build_from_document(discovery_document(api, version), credentials=creds)
+
+
+def get_spreadsheet_revision(creds, spreadsheet_id, drive=None):
+    """
+    Get the revision marker of the spreadsheet from the Drive API.
+    The version number increases on every change to the file.
+
+    :param drive: A Drive API client to reuse, built from creds if None.
+    """
+    if drive is None:
+        drive = build_service('drive', 'v3', creds)
+    return revision_from_metadata(execute_request(revision_request(drive, spreadsheet_id)))
+
+
+def revision_request(drive, spreadsheet_id):
+    """
+    Get the Drive API request of the revision marker of the spreadsheet.
+    """
+    return drive.files().get(fileId=spreadsheet_id, fields='version,modifiedTime')
+
+
+def revision_from_metadata(metadata):
+    return metadata.get('version') or metadata.get('modifiedTime')
+
+
+def retry_status(error):
     """
-    Merge cells in the specified column if they have the same value.
+    Get the HTTP status of a retryable API error: 429 and 5xx responses, or 0 for
+    connection errors and timeouts. Return None if the error must not be retried.
     """
-    merge_start = start_row
-    for row in range(start_row, end_row + 1):
-        if row == end_row or sheet.cell(row=row, column=col).value != sheet.cell(row=row + 1, column=col).value:
-            if merge_start != row:
-                sheet.merge_cells(start_row=merge_start, start_column=col, end_row=row, end_column=col)
-            merge_start = row + 1
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    if status is not None:
+        status = int(status)
+        return status if status in RETRY_STATUSES else None
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return 0
+    return None
+
+
+def retry_after_seconds(error):
+    """
+    Get the delay requested by the Retry-After header of an API error, if any.
+    """
+    resp = getattr(error, 'resp', None)
+    try:
+        return float(resp.get('retry-after')) if resp is not None and resp.get('retry-after') else None
+    except (TypeError, ValueError):
+        return None
 
 
-def adjust_column_widths(ws):
+class TokenBucket:
+    """
+    Asyncio token bucket: allow bursts of capacity requests, refilled at rate_per_minute.
     """
-    Adjust the column widths to fit the content.
+
+    def __init__(self, rate_per_minute, capacity):
+        import asyncio
+
+        if rate_per_minute <= 0:
+            raise ValueError(f"The rate limit must be positive, got {rate_per_minute} requests per minute")
+        if capacity < 1:
+            raise ValueError(f"The burst must be at least one request, got {capacity}")
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """
+        Wait for a token and return the seconds waited.
+        """
+        import asyncio
+
+        start = time.monotonic()
+        async with self.lock:
+            while True:
+                wait = self._take()
+                if not wait:
+                    return time.monotonic() - start
+                await asyncio.sleep(wait)
+
+    def acquire_blocking(self):
+        """
+        Wait for a token in the calling thread and return the seconds waited.
+        """
+        start = time.monotonic()
+        while True:
+            wait = self._take()
+            if not wait:
+                return time.monotonic() - start
+            time.sleep(wait)
+
+    def _take(self):
+        """
+        Take a token and return 0, or return the seconds until the next token.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def pause(self, seconds):
+        """
+        Stop handing out tokens for seconds, after the server reported the quota exceeded.
+        """
+        self.tokens = 0
+        self.updated = max(self.updated, time.monotonic() + seconds)
+
+
+class FetchScheduler:
     """
-    for col in ws.columns:
-        max_length = 0
-        column = col[0].column_letter  # Get the column name
-        for cell in col:
+    Execute API requests concurrently under a token-bucket rate limit, retrying throttled
+    (429) and server (5xx) errors, connection errors and timeouts with exponential backoff
+    and full jitter. A 429 also pauses the bucket, so the other requests back off too.
+    The blocking execute() calls run in worker threads, each with its own HTTP connection.
+
+    :param creds: The credentials of the connections, None for an unauthenticated server.
+    :param concurrency: The maximum number of requests in flight.
+    """
+
+    def __init__(self, creds=None, rate_per_minute=FETCH_RATE_PER_MINUTE, burst=FETCH_BURST, concurrency=4,
+                 max_retries=FETCH_MAX_RETRIES, backoff_base=FETCH_BACKOFF_BASE, backoff_max=FETCH_BACKOFF_MAX):
+        import asyncio
+
+        if concurrency < 1:
+            raise ValueError(f"The fetch concurrency must be at least 1, got {concurrency}")
+        self.creds = creds
+        self.bucket = TokenBucket(rate_per_minute, burst)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._local = threading.local()
+        self.latencies = []
+        self.rate_limit_wait = 0.0
+        self.retries = 0
+        self.throttled = 0
+        self.server_errors = 0
+        self.network_errors = 0
+        self.failures = 0
+
+    def _http(self):
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            import httplib2
+            http = httplib2.Http(timeout=FETCH_TIMEOUT)
+            if self.creds is not None:
+                import google_auth_httplib2
+                http = google_auth_httplib2.AuthorizedHttp(self.creds, http=http)
+            self._local.http = http
+        return http
+
+    def _execute(self, request):
+        # Runs in a worker thread: only measure the response, the profiler is updated by the event loop thread
+        result = request.execute(http=self._http())
+        return result, response_size(result) if PROFILER is not None else 0
+
+    async def execute(self, request):
+        """
+        Execute a request once a token is available, retrying it on retryable errors.
+        """
+        import asyncio
+
+        attempt = 0
+        while True:
+            self.rate_limit_wait += await self.bucket.acquire()
+            async with self.semaphore:
+                start = time.perf_counter()
+                try:
+                    result, size = await asyncio.to_thread(self._execute, request)
+                    error = None
+                except Exception as e:
+                    error = e
+                self.latencies.append(time.perf_counter() - start)
+            if error is None:
+                profile_record(api_calls=1, bytes_fetched=size)
+                return result
+
+            await asyncio.sleep(self._backoff(error, attempt))
+            attempt += 1
+
+    def execute_blocking(self, request):
+        """
+        Execute a request in the calling thread under the same rate limit and retries as
+        execute(), for the streaming modes that page through a sheet one request at a time.
+        """
+        attempt = 0
+        while True:
+            self.rate_limit_wait += self.bucket.acquire_blocking()
+            start = time.perf_counter()
             try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(cell.value)
-            except:
-                pass
-        adjusted_width = (max_length + 5)
-        ws.column_dimensions[column].width = adjusted_width
+                result = request.execute(http=self._http())
+                error = None
+            except Exception as e:
+                error = e
+            self.latencies.append(time.perf_counter() - start)
+            if error is None:
+                if PROFILER is not None:
+                    PROFILER.record(api_calls=1, bytes_fetched=response_size(result))
+                return result
+
+            time.sleep(self._backoff(error, attempt))
+            attempt += 1
+
+    def _backoff(self, error, attempt):
+        """
+        Count a failed attempt and return the seconds to wait before retrying it,
+        or raise the error if it must not be retried.
+        """
+        status = retry_status(error)
+        if status is None or attempt >= self.max_retries:
+            self.failures += 1
+            raise error
+
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if status == 429:
+            self.throttled += 1
+            delay = max(delay, retry_after_seconds(error) or 0)
+            self.bucket.pause(delay)
+        elif status:
+            self.server_errors += 1
+        else:
+            self.network_errors += 1
+        self.retries += 1
+        profile_record(api_retries=1)
+        reason = f"HTTP {status}" if status else type(error).__name__
+        print(f"* {reason}, retrying request in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+        return delay
+
+    def report(self):
+        """
+        Get the request count, latency percentiles in seconds and retry counts.
+        """
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 6) if latencies else None
+
+        return {
+            'requests': len(latencies),
+            'latency_p50': percentile(0.5),
+            'latency_p95': percentile(0.95),
+            'latency_max': percentile(1),
+            'rate_limit_wait': round(self.rate_limit_wait, 6),
+            'retries': self.retries,
+            'throttled': self.throttled,
+            'server_errors': self.server_errors,
+            'network_errors': self.network_errors,
+            'failures': self.failures,
+        }
+
+    def print_report(self):
+        report = self.report()
+        if report['requests']:
+            print(f"* Fetch: {report['requests']} request(s), latency p50 {report['latency_p50']:.3f}s "
+                  f"p95 {report['latency_p95']:.3f}s max {report['latency_max']:.3f}s, "
+                  f"{report['rate_limit_wait']:.1f}s waiting for the rate limit, {report['retries']} retries "
+                  f"({report['throttled']} throttled, {report['server_errors']} server errors, "
+                  f"{report['network_errors']} network errors), {report['failures']} failed")
+
+
+def cache_file_path(cache_dir, spreadsheet_id, sheet_id=None):
+    """
+    Get the cache file path of the spreadsheet metadata (sheet_id is None) or of a sheet's values.
+    """
+    name = f'{spreadsheet_id}.meta' if sheet_id is None else f'{spreadsheet_id}_{sheet_id}'
+    return os.path.join(cache_dir, f'{name}.json.gz')
 
 
-def post_process_and_save_to_excel(output_path, merge_col_names, group_by_col):
+def sheet_cache_id(properties):
     """
-    Process Excel file and merging cells with the same value.
+    Get the id of a sheet in the cache from its properties.
     """
-    # Load the workbook and the first sheet
-    wb = openpyxl.load_workbook(output_path)
-    ws = wb.active
+    return properties.get('sheetId', properties.get('index', 0))
 
-    max_row = ws.max_row + 1
-    group_by_col_index = excel_col_to_index(group_by_col) + 1
 
-    fill_colors = ['DDFFFF', 'FFFFFF']  # Light blue and white
-    thin_border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
+def load_cache_entry(cache_dir, spreadsheet_id, sheet_id=None, revision=None):
+    """
+    Load a cached entry. Return None if there is no entry or if its revision
+    does not match (a revision of None accepts any cached entry).
+    """
+    path = cache_file_path(cache_dir, spreadsheet_id, sheet_id)
+    if not os.path.exists(path):
+        return None
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            entry = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"* Warning: Ignoring unreadable cache file {path}: {str(e)}")
+        return None
+    if revision is not None and entry.get('revision') != revision:
+        return None
+    return entry['data']
+
+
+def save_cache_entry(cache_dir, spreadsheet_id, data, sheet_id=None, revision=None):
+    """
+    Save an entry into the cache as compact gzipped JSON.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_file_path(cache_dir, spreadsheet_id, sheet_id)
+    tmp_path = path + '.tmp'
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+        json.dump({'revision': revision, 'fetched_at': time.time(), 'data': data}, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def evict_cache(cache_dir, max_age_days=CACHE_MAX_AGE_DAYS, max_bytes=CACHE_MAX_BYTES):
+    """
+    Remove cache files older than max_age_days, then the least recently written
+    files until the cache fits into max_bytes.
+    """
+    if not os.path.isdir(cache_dir):
+        return
+    now = time.time()
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if not name.endswith('.json.gz') or not os.path.isfile(path):
+            continue
+        stat = os.stat(path)
+        if now - stat.st_mtime > max_age_days * 86400:
+            os.remove(path)
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        os.remove(path)
+        total_bytes -= size
+
+
+def sheet_range(properties):
+    """
+    Get the A1 range covering exactly the grid of a sheet.
+    """
+    title = properties['title'].replace("'", "''")
+    grid = properties.get('gridProperties')
+    if not grid:
+        return f"'{title}'!A1:ZZ"
+    return f"'{title}'!A1:{index_to_excel_col(max(grid.get('columnCount', 1), 1))}{max(grid.get('rowCount', 1), 1)}"
+
+
+def chunk_sheets_for_batch_get(sheets):
+    """
+    Split sheets into chunks that fit into one values.batchGet request.
+    """
+    chunks = []
+    chunk = []
+    chunk_cells = 0
+    for sheet in sheets:
+        grid = sheet['properties'].get('gridProperties', {})
+        cells = grid.get('rowCount', 0) * grid.get('columnCount', 0)
+        if chunk and (len(chunk) >= BATCH_GET_MAX_RANGES or chunk_cells + cells > BATCH_GET_MAX_CELLS):
+            chunks.append(chunk)
+            chunk = []
+            chunk_cells = 0
+        chunk.append(sheet)
+        chunk_cells += cells
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def fetch_sheet_values(service, spreadsheet_id, sheets):
+    """
+    Fetch the values of several sheets with as few values.batchGet calls as possible.
+    Return a dict of sheet title -> values.
+    """
+    sheet_values = {}
+    for chunk in chunk_sheets_for_batch_get(sheets):
+        result = execute_request(batch_get_request(service, spreadsheet_id, chunk))
+        for sheet, value_range in zip(chunk, result.get('valueRanges', [])):
+            sheet_values[sheet['properties']['title']] = value_range.get('values', [])
+    return sheet_values
+
+
+def batch_get_request(service, spreadsheet_id, sheets):
+    """
+    Get the values.batchGet request of a chunk of sheets, see chunk_sheets_for_batch_get.
+    """
+    return service.spreadsheets().values().batchGet(
+        spreadsheetId=spreadsheet_id,
+        ranges=[sheet_range(sheet['properties']) for sheet in sheets],
+        fields='valueRanges(values)'
+    )
+
+
+def iter_sheet_rows(service, spreadsheet_id, properties, chunk_rows=STREAM_CHUNK_ROWS, scheduler=None):
+    """
+    Page through the rows of a sheet, chunk_rows rows per request, up to the row count of its grid.
+
+    :param scheduler: The FetchScheduler rate limiting and retrying the requests, None to execute them directly.
+    """
+    execute = execute_request if scheduler is None else scheduler.execute_blocking
+    title = properties['title'].replace("'", "''")
+    grid = properties.get('gridProperties', {})
+    last_col = index_to_excel_col(max(grid.get('columnCount', 702), 1))
+    row_count = grid.get('rowCount')
+
+    start = 1
+    # Blank rows dropped from the end of the previous chunks, emitted once more data follows
+    # so that the row numbers (G-Row ID) stay aligned
+    blank_rows = 0
+    while row_count is None or start <= row_count:
+        end = start + chunk_rows - 1
+        if row_count is not None:
+            end = min(end, row_count)
+        result = execute(service.spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id,
+            range=f"'{title}'!A{start}:{last_col}{end}",
+            fields='values'
+        ))
+        values = result.get('values', [])
+        if values:
+            for _ in range(blank_rows):
+                yield []
+            blank_rows = 0
+            yield from values
+        blank_rows += end - start + 1 - len(values)
+        if blank_rows and row_count is None:
+            # Without the grid size a short chunk is taken as the end of the sheet
+            break
+        start = end + 1
+
+
+def find_group_spans(group_values):
+    """
+    Split a column into runs of consecutive equal values.
+    Return a list of (start, end) 0-based inclusive row ranges.
+    """
+    spans = []
+    start = 0
+    for row in range(1, len(group_values) + 1):
+        if row == len(group_values) or group_values[row] != group_values[start]:
+            spans.append((start, row - 1))
+            start = row
+    return spans
+
 
-    row = 2
-    while row < max_row:
-        group_by_value = ws.cell(row=row, column=group_by_col_index).value
+def column_width(header, values):
+    """
+    Compute the column width to fit the header and the text content.
+    """
+    max_length = len(header) if isinstance(header, str) else 0
+    for value in values:
+        if isinstance(value, str) and len(value) > max_length:
+            max_length = len(value)
+    return max_length + 5
 
-        merge_start = row
-        while row < max_row and ws.cell(row=row, column=group_by_col_index).value == group_by_value:
-            row += 1
-        merge_end = row - 1
 
+def append_styled_rows(ws, rows, plan, col_count):
+    """
+    Append rows to a write-only sheet one group at a time:
+    band each group with alternating fill colors, draw borders and merge the
+    merge columns when they have the same value inside a group.
+    Only the rows of the current group are kept in memory.
+    """
+    from openpyxl.styles import PatternFill, Border, Side
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.worksheet.cell_range import CellRange, MultiCellRange
+
+    # Shared style objects for every cell: the styles are registered once on a template
+    # cell per fill color and the cells copy the template's style ids (the StyleArray of
+    # every openpyxl cell since 2.4), the public cell.style setter is 3x slower per cell
+    thin_border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
+    style_templates = []
+    for color in FILL_COLORS:
+        template = WriteOnlyCell(ws)
+        template.fill = PatternFill(start_color=color, end_color=color, fill_type="solid")
+        template.border = thin_border
+        style_templates.append(template._style)
+
+    group_col = plan.group_by_col_idx - 1 if plan.group_by_col_idx <= col_count else None
+    merge_cols = [col_idx - 1 for col_idx in plan.merge_col_idx if col_idx <= col_count]
+    merged_ranges = []
+
+    def write_group(group, first_row):
         # group post process
-        stt_value = ws.cell(row=merge_start, column=1).value
-        color_index = int(stt_value) % len(fill_colors)
-        fill = PatternFill(start_color=fill_colors[color_index], end_color=fill_colors[color_index], fill_type="solid")
-        for r in range(merge_start, merge_end + 1):
-            for c in range(1, ws.max_column + 1):
-                # Apply fill color to the group
-                ws.cell(row=r, column=c).fill = fill
-                # Apply border to the group
-                ws.cell(row=r, column=c).border = thin_border
-
-        if merge_start < merge_end:
+        style = style_templates[int(group[0][0]) % len(style_templates)]
+
+        if len(group) > 1:
             # Merge cells in column if they have the same value
-            # print(f"* Merging cells for group '{group_by_value}' from rows {merge_start} to {merge_end}")
-            for col_name in merge_col_names:
-                col_index = excel_col_to_index(col_name) + 1
-                merge_cells_if_same(ws, merge_start, merge_end, col_index)
+            for c in merge_cols:
+                for run_start, run_end in find_group_spans([row[c] for row in group]):
+                    if run_start != run_end:
+                        merged_ranges.append(CellRange(min_col=c + 1, min_row=first_row + run_start,
+                                                       max_col=c + 1, max_row=first_row + run_end))
+
+        for row in group:
+            row_cells = []
+            for c in range(col_count):
+                cell = WriteOnlyCell(ws, value=row[c])
+                cell._style = copy(style)
+                row_cells.append(cell)
+            ws.append(row_cells)
+
+    group = []
+    first_row = 2
+    for row in rows:
+        if group and group_col is not None and row[group_col] != group[0][group_col]:
+            write_group(group, first_row)
+            first_row += len(group)
+            group = []
+        group.append(row)
+    if group:
+        write_group(group, first_row)
+
+    # The ranges never overlap, so set them all at once instead of paying the linear
+    # overlap check of merged_cells.add() for every range
+    ws.merged_cells = MultiCellRange([*ws.merged_cells.ranges, *merged_ranges])
+
+
+def write_styled_sheet(wb, sheet_name, df, plan):
+    """
+    Write a DataFrame into a write-only sheet in a single pass:
+    band each group with alternating fill colors, draw borders, merge the
+    merge columns when they have the same value inside a group and fit column widths.
+    """
+    ws = wb.create_sheet(title=sheet_name)
+    if df is None or df.empty:
+        return ws
+
+    headers = list(df.columns)
+    columns = [df[name].tolist() for name in headers]
+    col_count = len(headers)
+
+    # Column widths must be set before any row is written
+    for c in range(col_count):
+        ws.column_dimensions[index_to_excel_col(c + 1)].width = column_width(headers[c], columns[c])
+
+    ws.append(headers)
+    append_styled_rows(ws, zip(*columns), plan, col_count)
+
+    return ws
+
 
-    # Adjust column widths to fit the content
-    adjust_column_widths(ws)
+@profiled('save_styled_excel')
+def save_styled_excel(output_path, sheets, plan):
+    """
+    Save the processed sheets as a styled workbook in one streaming pass.
+
+    :param sheets: A list of (sheet_name, DataFrame or None) tuples.
+    """
+    import openpyxl
 
-    # Save the workbook
+    wb = openpyxl.Workbook(write_only=True)
+    for sheet_name, df in sheets:
+        profile_record(rows_in=0 if df is None else len(df))
+        write_styled_sheet(wb, sheet_name, df, plan)
     wb.save(output_path)
 
 
-def gsheet_to_xlsx(gsheet_path, output_path, column_mapping, sheet_indexes=[0]):
+def write_streamed_sheet(wb, sheet_name, output_rows, plan, tmp_dir=None):
     """
-    Convert a .gsheet file to .xlsx format, handling column mismatches
+    Write streamed output rows into a styled write-only sheet.
+    Column widths must be known before the first row is written, so the rows
+    are spilled once to a temporary file in tmp_dir while measuring them.
+
+    :return: The number of rows written, the sheet is left empty when there are none.
     """
-    try:
-        # Read the .gsheet file
-        with open(gsheet_path, 'r') as f:
-            gsheet_data = json.load(f)
-        
-        spreadsheet_id = gsheet_data.get('doc_id')
-        if not spreadsheet_id:
-            raise ValueError("Could not find spreadsheet ID in .gsheet file")
-        
+    headers = list(plan.output_columns)
+    ws = wb.create_sheet(title=sheet_name)
+    widths = [len(header) for header in headers]
+    row_total = 0
+    with tempfile.NamedTemporaryFile('w+', encoding='utf-8', dir=tmp_dir, suffix='.rows') as spill:
+        for row_data in output_rows:
+            for c, value in enumerate(row_data):
+                if isinstance(value, str) and len(value) > widths[c]:
+                    widths[c] = len(value)
+            spill.write(json.dumps(row_data, ensure_ascii=False, separators=(',', ':')))
+            spill.write('\n')
+            row_total += 1
+
+        profile_record(rows_out=row_total)
+        if row_total == 0:
+            return 0
+
+        for c, width in enumerate(widths):
+            ws.column_dimensions[index_to_excel_col(c + 1)].width = width + 5
+        ws.append(headers)
+
+        spill.seek(0)
+        append_styled_rows(ws, (json.loads(line) for line in spill), plan, len(headers))
+    return row_total
+
+
+@profiled('stream_sheets_to_excel')
+def stream_sheets_to_excel(output_path, sheet_rows, column_mapping, tmp_dir=None, duplicates_report_path=None):
+    """
+    Convert sheets row by row into a styled workbook with bounded memory.
+
+    Memory stays flat whatever the sheet size: at most STREAM_CHUNK_ROWS fetched rows,
+    STREAM_SORT_RUN_ROWS rows in the sort buffer plus one buffered row per spilled run,
+    and the rows of one household group are held at a time. Sorted runs and the
+    normalized rows are spilled to temporary files in tmp_dir (the system temp
+    directory by default), which needs about twice the sheet size of free space.
+
+    :param sheet_rows: A list of (sheet_name, iterator of rows) tuples.
+    :param duplicates_report_path: Save the superseded responses of every sheet to this JSON file.
+    """
+    import openpyxl
+
+    plan = compile_column_mapping(column_mapping)
+    wb = openpyxl.Workbook(write_only=True)
+    sheets_processed = 0
+    duplicates_report = {}
+
+    for sheet_name, rows in sheet_rows:
+        print(f"* Streaming sheet: {sheet_name}")
+        duplicates = duplicates_report.setdefault(sheet_name, [])
+        row_total = write_streamed_sheet(wb, sheet_name, stream_sheet_data(rows, plan, tmp_dir, duplicates_report=duplicates), plan, tmp_dir)
+        sheets_processed += 1
+        if row_total == 0:
+            print(f"* No valid data in sheet '{sheet_name}', skipping")
+            continue
+        print(f"* Successfully streamed {row_total} row(s) of sheet: {sheet_name}")
+
+    if sheets_processed == 0:
+        raise ValueError("No sheets could be processed successfully")
+
+    wb.save(output_path)
+    if duplicates_report_path:
+        save_duplicates_report(duplicates_report_path, duplicates_report)
+    return sheets_processed
+
+
+# Unstyled export formats and their file extensions
+EXPORT_EXTENSIONS = {
+    'parquet': '.parquet',
+    'csv': '.csv',
+    'arrow': '.arrow',
+}
+
+
+def export_path_for(output_path, sheet_name, export_format, sheet_count=1):
+    """
+    Get the path of an unstyled export next to the output file,
+    suffixed with the sheet name when several sheets are exported.
+    """
+    stem = os.path.splitext(output_path)[0]
+    if sheet_count > 1:
+        stem += '_' + re.sub(r'[^\w\-]+', '_', sheet_name)
+    return stem + EXPORT_EXTENSIONS[export_format]
+
+
+def typed_export_frame(df):
+    """
+    Get the result with proper column types for machine consumers:
+    integer group id (STT) and G-Row ID, dictionary-encoded text for the
+    categorical columns, text for everything else.
+    """
+    import pandas as pd
+
+    df = df.copy()
+    for name in df.columns:
+        if pd.api.types.is_integer_dtype(df[name]):
+            df[name] = df[name].astype('int64')
+        elif isinstance(df[name].dtype, pd.CategoricalDtype):
+            df[name] = df[name].cat.rename_categories(df[name].cat.categories.astype('string'))
+        else:
+            df[name] = df[name].astype('string')
+    return df
+
+
+@profiled('export_sheets')
+def export_sheets(output_path, sheets, export_format):
+    """
+    Export the processed sheets without styling or merged cells to Parquet, CSV or Arrow IPC.
+    Parquet and Arrow need the optional pyarrow package.
+
+    :param sheets: A list of (sheet_name, DataFrame or None) tuples.
+    """
+    if export_format not in EXPORT_EXTENSIONS:
+        raise ValueError(f"Unsupported export format: {export_format}")
+
+    sheets = [(sheet_name, df) for sheet_name, df in sheets if df is not None]
+    for sheet_name, df in sheets:
+        path = export_path_for(output_path, sheet_name, export_format, len(sheets))
+        profile_record(rows_in=len(df))
+        df = typed_export_frame(df)
+        if export_format == 'csv':
+            df.to_csv(path, index=False, encoding='utf-8')
+        else:
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise ValueError(f"Exporting to {export_format} requires the pyarrow package (pip install pyarrow)")
+            if export_format == 'parquet':
+                df.to_parquet(path, index=False)
+            else:
+                df.to_feather(path)
+        print(f"* Exported sheet '{sheet_name}' to {path}")
+
+
+def trim_row(row):
+    """
+    Remove the trailing empty cells of a row, like the Sheets API does.
+    """
+    end = len(row)
+    while end and row[end - 1] == '':
+        end -= 1
+    return row[:end] if end < len(row) else row
+
+
+def cell_to_text(value, number_format='General'):
+    """
+    Convert an XLSX cell value to the text the Sheets API would return.
+    Dates keep the time when the cell format shows it (form timestamps).
+    """
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        if 'h' in number_format.lower() or value.hour or value.minute or value.second:
+            return f'{value.month}/{value.day}/{value.year} {value.hour}:{value.minute:02d}:{value.second:02d}'
+        return f'{value.month}/{value.day}/{value.year}'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def iter_csv_rows(csv_path):
+    """
+    Stream the rows of a CSV export (e.g. Google Forms or Sheets "Download as CSV").
+    """
+    with open(csv_path, 'r', encoding='utf-8-sig', newline='') as f:
+        for row in csv.reader(f):
+            yield trim_row(row)
+
+
+def iter_xlsx_rows(ws):
+    """
+    Stream the rows of a read-only openpyxl worksheet as text.
+    """
+    for row in ws.iter_rows():
+        yield trim_row([cell_to_text(getattr(cell, 'value', None), getattr(cell, 'number_format', None) or 'General') for cell in row])
+
+
+def read_csv_source(csv_path, sheet_indexes=[0], stream=False):
+    """
+    Read a CSV export as a single sheet named after the file.
+    """
+    sheet_name = os.path.splitext(os.path.basename(csv_path))[0]
+    rows = iter_csv_rows(csv_path)
+    return [(sheet_name, rows if stream else list(rows))]
+
+
+def read_xlsx_source(xlsx_path, sheet_indexes=[0], stream=False):
+    """
+    Read the sheets at sheet_indexes of a local XLSX file with a read-only workbook.
+    """
+    import openpyxl
+
+    wb = openpyxl.load_workbook(xlsx_path, read_only=True, data_only=True)
+    sheets = [ws for index, ws in enumerate(wb.worksheets) if index in sheet_indexes] or wb.worksheets
+    if stream:
+        # The sheets share the workbook: close it once every one of them is exhausted or closed
+        open_sheets = [len(sheets)]
+
+        def stream_rows(ws):
+            try:
+                yield from iter_xlsx_rows(ws)
+            finally:
+                open_sheets[0] -= 1
+                if not open_sheets[0]:
+                    wb.close()
+
+        return [(ws.title, stream_rows(ws)) for ws in sheets]
+    sheet_values = [(ws.title, list(iter_xlsx_rows(ws))) for ws in sheets]
+    wb.close()
+    return sheet_values
+
+
+def read_json_source(json_path, sheet_indexes=[0], stream=False):
+    """
+    Read a raw JSON snapshot of sheet values (optionally gzipped). Accepted layouts:
+    a list of rows, a values.get response, a values.batchGet response or {"sheets": {name: rows}}.
+    """
+    opener = gzip.open if json_path.endswith('.gz') else open
+    with opener(json_path, 'rt', encoding='utf-8') as f:
+        snapshot = json.load(f)
+
+    sheet_name = os.path.basename(json_path).split('.')[0]
+    if isinstance(snapshot, dict) and 'revision' in snapshot and 'data' in snapshot:
+        # Entry of the local snapshot cache
+        snapshot = snapshot['data']
+    if isinstance(snapshot, list):
+        return [(sheet_name, snapshot)]
+    if 'values' in snapshot:
+        return [(sheet_name, snapshot['values'])]
+    if 'valueRanges' in snapshot:
+        return [(value_range.get('range', f'{sheet_name}_{index}').split('!')[0].strip("'"), value_range.get('values', []))
+                for index, value_range in enumerate(snapshot['valueRanges'])]
+    if isinstance(snapshot.get('sheets'), dict):
+        return list(snapshot['sheets'].items())
+    raise ValueError(f"Unrecognized JSON snapshot layout in {json_path}")
+
+
+# Readers of local sources by file extension; .gsheet files are read through the Sheets API
+SOURCE_READERS = {
+    '.csv': read_csv_source,
+    '.xlsx': read_xlsx_source,
+    '.xlsm': read_xlsx_source,
+    '.json': read_json_source,
+    '.gz': read_json_source,
+}
+
+
+def source_reader(path):
+    """
+    Get the reader of a local source, or None for a .gsheet file.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.gsheet':
+        return None
+    if ext not in SOURCE_READERS:
+        raise ValueError(f"Unsupported source file: {path}")
+    return SOURCE_READERS[ext]
+
+
+def read_spreadsheet_id(gsheet_path):
+    """
+    Read the spreadsheet ID from a .gsheet file.
+    """
+    with open(gsheet_path, 'r') as f:
+        gsheet_data = json.load(f)
+    
+    spreadsheet_id = gsheet_data.get('doc_id')
+    if not spreadsheet_id:
+        raise ValueError("Could not find spreadsheet ID in .gsheet file")
+    return spreadsheet_id
+
+
+def select_sheets(spreadsheet, sheet_indexes=[0]):
+    """
+    Select the visible sheets at sheet_indexes from the spreadsheet metadata.
+    """
+    sheets = spreadsheet.get('sheets', [])
+    
+    if not sheets:
+        raise ValueError("No sheets found in the spreadsheet")
+    
+    # Filter for visible sheets
+    visible_sheets = [sheet for sheet in sheets 
+                    if not sheet.get('properties', {}).get('hidden', False) and sheet.get('properties', {}).get('index', 0) in sheet_indexes]
+    
+    if not visible_sheets:
+        print("* Warning: All sheets are hidden. Attempting to use all sheets instead.")
+        visible_sheets = sheets
+    
+    print(f"* Found {len(visible_sheets)} sheet(s)")
+
+    return visible_sheets
+
+
+def load_cached_sheet_values(cache_dir, spreadsheet_id, sheets, revision=None):
+    """
+    Get a dict of sheet title -> values of the sheets found in the cache.
+    """
+    sheet_values = {}
+    for sheet in sheets:
+        properties = sheet['properties']
+        values = load_cache_entry(cache_dir, spreadsheet_id, sheet_cache_id(properties), revision)
+        if values is not None:
+            print(f"* Using cached values of sheet: {properties['title']}")
+            sheet_values[properties['title']] = values
+    return sheet_values
+
+
+@profiled('fetch_spreadsheet')
+def fetch_spreadsheet(spreadsheet_id, sheet_indexes=[0], offline=False, refresh=False, cache_dir=CACHE_DIR, creds=None, service=None, revision=None):
+    """
+    Get the values of the selected sheets, from the local cache when it is up to date.
+    Return a list of (sheet_name, values) tuples, values is None if the sheet could not be loaded.
+
+    :param revision: The revision marker if already known, fetched from the Drive API otherwise.
+    """
+    if offline:
+        revision = None
+        # Convert purely from the local cache
+        spreadsheet = load_cache_entry(cache_dir, spreadsheet_id)
+        if spreadsheet is None:
+            raise ValueError(f"No cached snapshot of spreadsheet {spreadsheet_id} in {cache_dir}")
+        print(f"* Offline mode: using cached snapshot from {cache_dir}")
+    else:
         # Get cached credentials
-        creds = get_credentials()
+        if creds is None:
+            creds = get_credentials()
         
         # Build the Sheets API service
-        service = build('sheets', 'v4', credentials=creds)
-        
+        if service is None:
+            service = build_service('sheets', 'v4', creds)
+
+        # Get the revision marker to validate the cache
+        if revision is None:
+            try:
+                revision = get_spreadsheet_revision(creds, spreadsheet_id)
+            except Exception as e:
+                # e.g. the Drive API is not enabled: without a revision the cache cannot be trusted
+                print(f"* Warning: Could not get the revision of the spreadsheet, ignoring the cache: {str(e)}")
+                refresh = True
+
         # Get all sheets in the spreadsheet
-        spreadsheet = service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
-        sheets = spreadsheet.get('sheets', [])
-        
-        if not sheets:
-            raise ValueError("No sheets found in the spreadsheet")
-        
-        # Filter for visible sheets
-        visible_sheets = [sheet for sheet in sheets 
-                        if not sheet.get('properties', {}).get('hidden', False) and sheet.get('properties', {}).get('index', 0) in sheet_indexes]
-        
-        if not visible_sheets:
-            print("* Warning: All sheets are hidden. Attempting to use all sheets instead.")
-            visible_sheets = sheets
-        
-        print(f"* Found {len(visible_sheets)} sheet(s)")
-        
-        # Create Excel writer
-        writer = pd.ExcelWriter(output_path, engine='openpyxl')
-        sheets_processed = 0
-        
+        spreadsheet = None if refresh else load_cache_entry(cache_dir, spreadsheet_id, revision=revision)
+        if spreadsheet is None:
+            spreadsheet = execute_request(service.spreadsheets().get(spreadsheetId=spreadsheet_id, fields=SPREADSHEET_FIELDS))
+            save_cache_entry(cache_dir, spreadsheet_id, spreadsheet, revision=revision)
+
+    visible_sheets = select_sheets(spreadsheet, sheet_indexes)
+
+    # Load the cached values, then fetch the missing sheets together
+    sheet_values = {}
+    if offline or not refresh:
+        sheet_values = load_cached_sheet_values(cache_dir, spreadsheet_id, visible_sheets, None if offline else revision)
+
+    missing_sheets = [sheet for sheet in visible_sheets if sheet['properties']['title'] not in sheet_values]
+    if missing_sheets and not offline:
         try:
-            for sheet in visible_sheets:
+            fetched_values = fetch_sheet_values(service, spreadsheet_id, missing_sheets)
+            for sheet in missing_sheets:
                 properties = sheet['properties']
-                sheet_name = properties['title']
-                print(f"* Processing sheet: {sheet_name}")
-                
-                try:
-                    # Get the sheet data
-                    result = service.spreadsheets().values().get(
-                        spreadsheetId=spreadsheet_id,
-                        range=f'{sheet_name}!A1:ZZ'
-                    ).execute()
-                    
-                    values = result.get('values', [])
-                    if not values:
-                        print(f"* Sheet '{sheet_name}' is empty, skipping")
-                        continue
-                    
-                    # Process the sheet data
-                    final_df = process_sheet_data(values, column_mapping)
-                    if final_df is None:
-                        # Create an empty DataFrame
-                        final_df = pd.DataFrame()
-                        final_df.to_excel(writer, sheet_name=sheet_name, index=False)
-                        sheets_processed += 1
-                        print(f"* No valid data in sheet '{sheet_name}', skipping")
-                        continue
-                    
-                    # Write to Excel
-                    final_df.to_excel(writer, sheet_name=sheet_name, index=False)
-                    sheets_processed += 1
-                    print(f"* Successfully processed sheet: {sheet_name}")
-                    
-                except Exception as e:
-                    print(f"* Error processing sheet '{sheet_name}': {str(e)}")
-                    continue
+                values = fetched_values.get(properties['title'], [])
+                save_cache_entry(cache_dir, spreadsheet_id, values, sheet_cache_id(properties), revision)
+                sheet_values[properties['title']] = values
+        except Exception as e:
+            print(f"* Error fetching sheet values: {str(e)}")
+
+    return [(sheet['properties']['title'], sheet_values.get(sheet['properties']['title'])) for sheet in visible_sheets]
+
+
+async def fetch_spreadsheet_async(scheduler, spreadsheet_id, sheet_indexes=[0], refresh=False, cache_dir=CACHE_DIR, service=None, drive=None):
+    """
+    Get the values of the selected sheets like fetch_spreadsheet, with every API request
+    going through the scheduler and the missing value chunks fetched concurrently.
+    """
+    import asyncio
+
+    if service is None:
+        service = build_service('sheets', 'v4', scheduler.creds)
+    if drive is None:
+        drive = build_service('drive', 'v3', scheduler.creds)
+
+    # Get the revision marker to validate the cache
+    revision = None
+    try:
+        revision = revision_from_metadata(await scheduler.execute(revision_request(drive, spreadsheet_id)))
+    except Exception as e:
+        # e.g. the Drive API is not enabled: without a revision the cache cannot be trusted
+        print(f"* Warning: Could not get the revision of the spreadsheet, ignoring the cache: {str(e)}")
+        refresh = True
+
+    spreadsheet = None if refresh else load_cache_entry(cache_dir, spreadsheet_id, revision=revision)
+    if spreadsheet is None:
+        spreadsheet = await scheduler.execute(service.spreadsheets().get(spreadsheetId=spreadsheet_id, fields=SPREADSHEET_FIELDS))
+        save_cache_entry(cache_dir, spreadsheet_id, spreadsheet, revision=revision)
+
+    visible_sheets = select_sheets(spreadsheet, sheet_indexes)
+    sheet_values = {} if refresh else load_cached_sheet_values(cache_dir, spreadsheet_id, visible_sheets, revision)
+
+    missing_sheets = [sheet for sheet in visible_sheets if sheet['properties']['title'] not in sheet_values]
+    chunks = chunk_sheets_for_batch_get(missing_sheets)
+    results = await asyncio.gather(*(scheduler.execute(batch_get_request(service, spreadsheet_id, chunk)) for chunk in chunks),
+                                   return_exceptions=True)
+    for chunk, result in zip(chunks, results):
+        if isinstance(result, Exception):
+            print(f"* Error fetching sheet values: {str(result)}")
+            continue
+        fetched_values = {sheet['properties']['title']: value_range.get('values', [])
+                          for sheet, value_range in zip(chunk, result.get('valueRanges', []))}
+        for sheet in chunk:
+            properties = sheet['properties']
+            values = fetched_values.get(properties['title'], [])
+            save_cache_entry(cache_dir, spreadsheet_id, values, sheet_cache_id(properties), revision)
+            sheet_values[properties['title']] = values
+
+    return [(sheet['properties']['title'], sheet_values.get(sheet['properties']['title'])) for sheet in visible_sheets]
+
+
+def convert_sheet_values(sheet_values, output_path, column_mapping, incremental=False, duplicates_report_path=None,
+                         export_formats=(), write_xlsx=True):
+    """
+    Process the values of each sheet and save them as a styled workbook.
+    Return the number of processed sheets.
+
+    :param duplicates_report_path: Save the superseded responses of every sheet to this JSON file.
+    :param export_formats: Also export the unstyled result in these formats, see export_sheets.
+    :param write_xlsx: Save the styled workbook; turn off for machine consumers of the exports.
+    """
+    plan = compile_column_mapping(column_mapping)
+    processed_sheets = []
+    duplicates_report = {}
+    if incremental:
+        incremental_state = load_incremental_state(output_path)
+
+    for sheet_name, values in sheet_values:
+        print(f"* Processing sheet: {sheet_name}")
+        
+        try:
+            if values is None:
+                print(f"* Sheet '{sheet_name}' could not be loaded, skipping")
+                continue
+
+            if not values:
+                print(f"* Sheet '{sheet_name}' is empty, skipping")
+                continue
             
-            if sheets_processed == 0:
-                raise ValueError("No sheets could be processed successfully")
-                       
-            print(f"* Successfully converted {gsheet_path} to {output_path}")
-            print(f"* Total sheets processed: {sheets_processed}")
+            # Process the sheet data
+            duplicates = duplicates_report.setdefault(sheet_name, [])
+            if incremental:
+                final_df, incremental_state['sheets'][sheet_name] = process_sheet_data_incremental(
+                    values, plan, incremental_state['sheets'].get(sheet_name), duplicates)
+            else:
+                final_df = process_sheet_data(values, plan, duplicates)
+            processed_sheets.append((sheet_name, final_df))
+            if final_df is None:
+                print(f"* No valid data in sheet '{sheet_name}', skipping")
+                continue
             
-        finally:
-            # Make sure we close the writer even if an error occurs
-            if writer:
-                writer.close()
+            print(f"* Successfully processed sheet: {sheet_name}")
+            
+        except Exception as e:
+            print(f"* Error processing sheet '{sheet_name}': {str(e)}")
+            continue
+    
+    if not processed_sheets:
+        raise ValueError("No sheets could be processed successfully")
+
+    # Write the styled workbook and the unstyled exports from the same data
+    if write_xlsx:
+        save_styled_excel(output_path, processed_sheets, plan)
+    for export_format in export_formats:
+        export_sheets(output_path, processed_sheets, export_format)
+    if incremental:
+        save_incremental_state(output_path, incremental_state)
+    if duplicates_report_path:
+        save_duplicates_report(duplicates_report_path, duplicates_report)
 
-        post_process_and_save_to_excel(output_path, column_mapping['dest_merge_cells_ids'], column_mapping['dest_group_by_id']) 
+    return len(processed_sheets)
+
+
+def save_duplicates_report(path, duplicates_report):
+    """
+    Save a dict of sheet (or source) name -> superseded responses as JSON.
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(duplicates_report, f, ensure_ascii=False, indent=2)
+
+
+@profiled('gsheet_to_xlsx')
+def gsheet_to_xlsx(gsheet_path, output_path, column_mapping, sheet_indexes=[0], offline=False, refresh=False, cache_dir=CACHE_DIR, incremental=False, stream=False, duplicates_report_path=None,
+                   export_formats=(), write_xlsx=True, rate_per_minute=FETCH_RATE_PER_MINUTE, max_retries=FETCH_MAX_RETRIES):
+    """
+    Convert a .gsheet file to .xlsx format, handling column mismatches
+
+    :param gsheet_path: A .gsheet file, or a local .csv, .xlsx or .json export (see SOURCE_READERS).
+    :param offline: Convert only from the local cache, without any API call.
+    :param refresh: Ignore the cached values and download them again.
+    :param cache_dir: The directory of the local snapshot cache.
+    :param incremental: Only process the responses added since the previous export.
+    :param stream: Page through the sheets and convert them with bounded memory, see stream_sheets_to_excel.
+    :param duplicates_report_path: Save the superseded responses to this JSON file.
+    :param export_formats: Also export the unstyled result next to output_path (parquet, csv, arrow).
+    :param write_xlsx: Save the styled workbook; turn off to only write the exports.
+    :param rate_per_minute: The maximum number of API requests per minute, see FetchScheduler.
+    :param max_retries: The retries of a throttled or failed API request.
+    """
+    import asyncio
+
+    try:
+        # Compile and validate the column mapping once for every sheet
+        plan = compile_column_mapping(column_mapping)
+
+        reader = source_reader(gsheet_path)
+        if reader is None:
+            # Read the .gsheet file
+            spreadsheet_id = read_spreadsheet_id(gsheet_path)
+
+        if stream and incremental:
+            raise ValueError("Streaming mode cannot be combined with incremental mode")
+        if stream and (export_formats or not write_xlsx):
+            raise ValueError("Streaming mode only writes the styled workbook")
+        if not write_xlsx and not export_formats:
+            raise ValueError("Nothing to write: the styled workbook is disabled and no export format is selected")
+
+        if reader is not None:
+            # Local source at local-disk speed, no credentials needed
+            sheet_values = reader(gsheet_path, sheet_indexes, stream)
+            if stream:
+                sheets_processed = stream_sheets_to_excel(output_path, sheet_values, plan, duplicates_report_path=duplicates_report_path)
+            else:
+                sheets_processed = convert_sheet_values(sheet_values, output_path, plan, incremental, duplicates_report_path, export_formats, write_xlsx)
+        elif stream:
+            scheduler = None if offline else FetchScheduler(get_credentials(), rate_per_minute, max_retries=max_retries)
+            sheet_rows = open_sheet_rows(gsheet_path, sheet_indexes, offline, refresh, cache_dir, scheduler=scheduler)
+            sheets_processed = stream_sheets_to_excel(output_path, sheet_rows, plan, duplicates_report_path=duplicates_report_path)
+            if scheduler is not None:
+                scheduler.print_report()
+        elif offline:
+            sheet_values = fetch_spreadsheet(spreadsheet_id, sheet_indexes, offline, refresh, cache_dir)
+            sheets_processed = convert_sheet_values(sheet_values, output_path, plan, incremental, duplicates_report_path, export_formats, write_xlsx)
+        else:
+            scheduler = FetchScheduler(get_credentials(), rate_per_minute, max_retries=max_retries)
+            with profile_stage('fetch_spreadsheet'):
+                sheet_values = asyncio.run(fetch_spreadsheet_async(scheduler, spreadsheet_id, sheet_indexes, refresh, cache_dir))
+            scheduler.print_report()
+            sheets_processed = convert_sheet_values(sheet_values, output_path, plan, incremental, duplicates_report_path, export_formats, write_xlsx)
+                   
+        print(f"* Successfully converted {gsheet_path} to {output_path}")
+        print(f"* Total sheets processed: {sheets_processed}")
+
+        evict_cache(cache_dir)
                 
     except Exception as e:
         print(f"* An error occurred: {str(e)}")
         raise
 
+
+def open_sheet_rows(gsheet_path, sheet_indexes=[0], offline=False, refresh=False, cache_dir=CACHE_DIR, service=None, scheduler=None):
+    """
+    Open the selected sheets of a .gsheet file or a local source for streaming.
+    Online .gsheet files are paged straight from the API, the cache would hold the whole sheet.
+
+    :param scheduler: The FetchScheduler of the page requests, created with the default limits if None.
+
+    :return: A list of (sheet_name, iterator of rows) tuples, header first.
+    """
+    reader = source_reader(gsheet_path)
+    if reader is not None:
+        return reader(gsheet_path, sheet_indexes, True)
+
+    spreadsheet_id = read_spreadsheet_id(gsheet_path)
+    if offline:
+        return [(sheet_name, values) for sheet_name, values in fetch_spreadsheet(spreadsheet_id, sheet_indexes, offline, refresh, cache_dir)
+                if values is not None]
+
+    if scheduler is None:
+        scheduler = FetchScheduler(get_credentials())
+    if service is None:
+        service = build_service('sheets', 'v4', scheduler.creds)
+    spreadsheet = scheduler.execute_blocking(service.spreadsheets().get(spreadsheetId=spreadsheet_id, fields=SPREADSHEET_FIELDS))
+    return [(sheet['properties']['title'], iter_sheet_rows(service, spreadsheet_id, sheet['properties'], scheduler=scheduler))
+            for sheet in select_sheets(spreadsheet, sheet_indexes)]
+
+
+@profiled('consolidate_to_xlsx')
+def consolidate_to_xlsx(gsheet_paths, output_path, column_mapping, sheet_indexes=[0], offline=False, refresh=False, cache_dir=CACHE_DIR,
+                        sheet_name=CONSOLIDATED_SHEET_NAME, tmp_dir=None, rate_per_minute=FETCH_RATE_PER_MINUTE,
+                        max_retries=FETCH_MAX_RETRIES, duplicates_report_path=None):
+    """
+    Convert several sources (e.g. the spreadsheets of every ward) into one consolidated
+    sheet with continuous STT numbering and group banding, see stream_consolidated_data.
+    The sources are opened one at a time and never held in memory together.
+
+    :param gsheet_paths: The .gsheet files or local sources, in order of precedence on equal timestamps.
+    :param sheet_name: The name of the consolidated sheet.
+    :param tmp_dir: The directory of the temporary sorted runs, the system temp directory by default.
+    :param rate_per_minute: The maximum number of API requests per minute, see FetchScheduler.
+    :param max_retries: The retries of a throttled or failed API request.
+    :param duplicates_report_path: Save the superseded responses of every source to this JSON file,
+                                   including the ones superseded by another source.
+    """
+    import openpyxl
+
+    try:
+        plan = compile_column_mapping(column_mapping)
+
+        # One authorized client and one rate limit for every spreadsheet
+        scheduler = service = None
+        if not offline and any(source_reader(path) is None for path in gsheet_paths):
+            scheduler = FetchScheduler(get_credentials(), rate_per_minute, max_retries=max_retries)
+            service = build_service('sheets', 'v4', scheduler.creds)
+
+        def sources():
+            for path in gsheet_paths:
+                for source_sheet, rows in open_sheet_rows(path, sheet_indexes, offline, refresh, cache_dir, service, scheduler):
+                    yield f"{os.path.basename(path)}/{source_sheet}", rows
+
+        wb = openpyxl.Workbook(write_only=True)
+        duplicates_report = {}
+        row_total = write_streamed_sheet(wb, sheet_name, stream_consolidated_data(sources(), plan, tmp_dir, duplicates_report=duplicates_report),
+                                         plan, tmp_dir)
+        if row_total == 0:
+            raise ValueError("No valid data in any source")
+        wb.save(output_path)
+        if duplicates_report_path:
+            save_duplicates_report(duplicates_report_path, duplicates_report)
+
+        print(f"* Successfully consolidated {len(gsheet_paths)} source(s) into {output_path}: {row_total} row(s)")
+        if scheduler is not None:
+            scheduler.print_report()
+        evict_cache(cache_dir)
+        return row_total
+
+    except Exception as e:
+        print(f"* An error occurred: {str(e)}")
+        raise
+
+
+def watch_gsheet(gsheet_path, output_path, column_mapping, sheet_indexes=[0], interval=60, max_backoff=900, max_cycles=None,
+                 cache_dir=CACHE_DIR, incremental=False, duplicates_report_path=None, export_formats=(), write_xlsx=True):
+    """
+    Keep converting a .gsheet file (or a local source) whenever it changes.
+    One authorized client is kept for the whole session; every cycle only polls the
+    Drive revision (or the file modification time of a local source) and reconverts
+    when it changed. Failed cycles are retried with exponential backoff.
+
+    :param interval: Seconds between two polls.
+    :param max_backoff: Maximum seconds to wait after repeated failures.
+    :param max_cycles: Stop after this many polls, None to run until interrupted.
+    """
+    plan = compile_column_mapping(column_mapping)
+    reader = source_reader(gsheet_path)
+    if reader is None:
+        spreadsheet_id = read_spreadsheet_id(gsheet_path)
+        creds = get_credentials()
+        service = build_service('sheets', 'v4', creds)
+        drive = build_service('drive', 'v3', creds)
+
+    last_revision = None
+    failures = 0
+    cycle = 0
+    print(f"* Watching {gsheet_path} every {interval}s, press Ctrl+C to stop")
+
+    try:
+        while max_cycles is None or cycle < max_cycles:
+            cycle += 1
+            start = time.perf_counter()
+            try:
+                if reader is None:
+                    revision = get_spreadsheet_revision(creds, spreadsheet_id, drive)
+                else:
+                    revision = os.stat(gsheet_path).st_mtime_ns
+                poll_time = time.perf_counter() - start
+
+                if revision == last_revision:
+                    print(f"* [cycle {cycle}] No change (revision {revision}), poll {poll_time:.3f}s")
+                else:
+                    if reader is None:
+                        sheet_values = fetch_spreadsheet(spreadsheet_id, sheet_indexes, cache_dir=cache_dir,
+                                                         creds=creds, service=service, revision=revision)
+                    else:
+                        sheet_values = reader(gsheet_path, sheet_indexes)
+                    fetch_time = time.perf_counter() - start - poll_time
+                    convert_sheet_values(sheet_values, output_path, plan, incremental, duplicates_report_path, export_formats, write_xlsx)
+                    last_revision = revision
+                    print(f"* [cycle {cycle}] Converted revision {revision} to {output_path}: poll {poll_time:.3f}s, "
+                          f"fetch {fetch_time:.3f}s, total {time.perf_counter() - start:.3f}s")
+                failures = 0
+                delay = interval
+            except Exception as e:
+                failures += 1
+                delay = min(interval * 2 ** failures, max_backoff)
+                print(f"* [cycle {cycle}] Error: {str(e)}, retrying in {delay}s")
+
+            if max_cycles is None or cycle < max_cycles:
+                time.sleep(delay)
+    except KeyboardInterrupt:
+        print("* Watch stopped")
+    finally:
+        evict_cache(cache_dir)
+
+
+def expand_gsheet_paths(paths):
+    """
+    Expand directories and glob patterns into a sorted list of .gsheet files and local
+    sources (see SOURCE_READERS). Directories are expanded to every supported extension,
+    except the lock files (~$name.xlsx) of open Excel workbooks.
+    """
+    gsheet_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            for ext in ('.gsheet', *SOURCE_READERS):
+                gsheet_paths.extend(file_path for file_path in glob.glob(os.path.join(glob.escape(path), '*' + ext))
+                                    if not os.path.basename(file_path).startswith('~$'))
+        elif glob.has_magic(path):
+            gsheet_paths.extend(glob.glob(path))
+        else:
+            gsheet_paths.append(path)
+    return sorted(dict.fromkeys(gsheet_paths))
+
+
+def batch_output_paths(gsheet_paths, output_dir):
+    """
+    Get a dict of gsheet path -> output .xlsx path in batch mode, named after the file.
+    Files with the same name (e.g. ward1/X.gsheet and ward2/X.gsheet) are prefixed
+    with their parent directory.
+    """
+    def stem(path):
+        return os.path.splitext(os.path.basename(path))[0]
+
+    stems = [stem(path) for path in gsheet_paths]
+    output_paths = {}
+    for path in gsheet_paths:
+        name = stem(path)
+        if stems.count(name) > 1:
+            name = f"{os.path.basename(os.path.dirname(os.path.abspath(path)))}_{name}"
+        output_paths[path] = os.path.join(output_dir, name + '.xlsx')
+
+    seen = {}
+    for path, output_path in output_paths.items():
+        key = os.path.normcase(output_path)
+        if key in seen:
+            raise ValueError(f"{seen[key]} and {path} would both be converted to {output_path}")
+        seen[key] = path
+    return output_paths
+
+
+async def _fetch_gsheet(gsheet_path, scheduler, local_slots, sheet_indexes, offline, refresh, cache_dir, service, drive):
+    """
+    Fetch the sheet values of one .gsheet file through the scheduler, or read a local
+    source or cached snapshot in a worker thread, at most local_slots at a time.
+    """
+    import asyncio
+
+    reader = source_reader(gsheet_path)
+    if reader is not None:
+        async with local_slots:
+            return await asyncio.to_thread(reader, gsheet_path, sheet_indexes)
+
+    spreadsheet_id = read_spreadsheet_id(gsheet_path)
+    if offline:
+        async with local_slots:
+            return await asyncio.to_thread(fetch_spreadsheet, spreadsheet_id, sheet_indexes, offline, refresh, cache_dir)
+    return await fetch_spreadsheet_async(scheduler, spreadsheet_id, sheet_indexes, refresh, cache_dir, service, drive)
+
+
+@profiled('gsheets_to_xlsx_batch')
+def gsheets_to_xlsx_batch(gsheet_paths, output_dir, column_mapping, sheet_indexes=[0], offline=False, refresh=False,
+                          cache_dir=CACHE_DIR, incremental=False, fetch_concurrency=4, max_workers=None,
+                          export_formats=(), write_xlsx=True, rate_per_minute=FETCH_RATE_PER_MINUTE, max_retries=FETCH_MAX_RETRIES,
+                          duplicates_report_name=None):
+    """
+    Convert many .gsheet files or local sources (paths, directories or glob patterns) into output_dir.
+    Fetch concurrently with one shared credential through a FetchScheduler, then process
+    and write each file in a process pool as soon as it is fetched.
+
+    :param fetch_concurrency: The maximum number of API requests (or local reads) at the same time.
+    :param max_workers: The number of processes, defaults to the number of CPUs.
+    :param rate_per_minute: The maximum number of API requests per minute.
+    :param max_retries: The retries of a throttled or failed API request.
+    :param duplicates_report_name: Save the superseded responses of every file next to its output,
+                                   as <output name>.<duplicates_report_name>.
+    :return: A dict of gsheet path -> None on success or the error message.
+    """
+    import asyncio
+
+    plan = compile_column_mapping(column_mapping)
+    gsheet_paths = expand_gsheet_paths(gsheet_paths)
+    if not gsheet_paths:
+        raise ValueError("No .gsheet files or local sources found")
+
+    output_paths = batch_output_paths(gsheet_paths, output_dir)
+
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"* Converting {len(gsheet_paths)} file(s) into {output_dir}")
+
+    needs_api = not offline and any(source_reader(path) is None for path in gsheet_paths)
+    creds = get_credentials() if needs_api else None
+    scheduler = FetchScheduler(creds, rate_per_minute, concurrency=fetch_concurrency, max_retries=max_retries)
+    results = {}
+
+    # Spawn the workers: forking while fetch threads hold the import lock (lazy imports)
+    # would deadlock the child processes
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) as process_pool:
+        conversions = {}
+
+        async def fetch_all():
+            # One client for every spreadsheet, the requests are only built in the event loop thread
+            service = drive = None
+            if needs_api:
+                service = build_service('sheets', 'v4', creds)
+                drive = build_service('drive', 'v3', creds)
+            local_slots = asyncio.Semaphore(fetch_concurrency)
+
+            async def fetch(path):
+                try:
+                    return path, await _fetch_gsheet(path, scheduler, local_slots, sheet_indexes, offline, refresh, cache_dir, service, drive), None
+                except Exception as e:
+                    return path, None, e
+
+            for next_fetch in asyncio.as_completed([fetch(path) for path in gsheet_paths]):
+                path, sheet_values, error = await next_fetch
+                if error is not None:
+                    results[path] = f"fetch failed: {str(error)}"
+                    continue
+                duplicates_report_path = None
+                if duplicates_report_name:
+                    duplicates_report_path = f"{os.path.splitext(output_paths[path])[0]}.{duplicates_report_name}"
+                conversion = process_pool.submit(convert_sheet_values, sheet_values, output_paths[path], plan, incremental,
+                                                 duplicates_report_path, export_formats, write_xlsx)
+                conversions[conversion] = path
+
+        with profile_stage('fetch_spreadsheets'):
+            asyncio.run(fetch_all())
+
+        for future in as_completed(conversions):
+            path = conversions[future]
+            try:
+                future.result()
+                results[path] = None
+            except Exception as e:
+                results[path] = f"conversion failed: {str(e)}"
+
+    for path in gsheet_paths:
+        if results[path] is None:
+            print(f"* [OK] {path} -> {output_paths[path]}")
+        else:
+            print(f"* [FAILED] {path}: {results[path]}")
+    print(f"* Converted {sum(error is None for error in results.values())}/{len(gsheet_paths)} file(s)")
+    scheduler.print_report()
+
+    evict_cache(cache_dir)
+    return results
+
 # Example usage showing how to handle columns beyond Z
 if __name__ == "__main__":
     column_mapping = {
@@ -493,6 +2599,8 @@ if __name__ == "__main__":
         'dest_group_by_id': 'C',
         'dest_group_by_name': 'MÃ CĂN HỘ',
 
+        'dest_categorical_names': ['BLOCK', 'CHÍNH CHỦ/THUÊ', 'GIỚI TÍNH', 'QH VỚI CHỦ HỘ/NGƯỜI THUÊ', 'THÔNG TIN CHỦ CŨ', 'THÔNG TIN CHỦ HỘ'],
+
         'normalize_name_idx': 0,
         'normalize_birthday_idx': 3,
         'normalize_phone_idx': 4,
@@ -500,11 +2608,92 @@ if __name__ == "__main__":
     }
 
     parser = argparse.ArgumentParser(description='Convert Google Sheets to XLSX.')
-    parser.add_argument('gsheet_path', type=str, help='Path to the Google Sheet file')
-    parser.add_argument('output_path', type=str, help='Path to the output XLSX file')
+    parser.add_argument('gsheet_path', type=str, nargs='+', help='Path to the Google Sheet file or a local CSV, XLSX or JSON export (several files, directories or glob patterns in batch mode)')
+    parser.add_argument('output_path', type=str, help='Path to the output XLSX file (output directory in batch mode)')
+    parser.add_argument('--batch', action='store_true', help='Convert many Google Sheet files into the output directory')
+    parser.add_argument('--jobs', type=int, default=None, help='Number of worker processes in batch mode (default: number of CPUs)')
+    parser.add_argument('--fetch-concurrency', type=int, default=4, help='Maximum number of API requests (or local reads in batch mode) in flight at the same time')
+    parser.add_argument('--offline', action='store_true', help='Convert only from the local cache, without calling the API')
+    parser.add_argument('--refresh', action='store_true', help='Ignore the local cache and download the sheet values again')
+    parser.add_argument('--incremental', action='store_true', help='Only process the responses added since the previous export')
+    parser.add_argument('--stream', action='store_true', help='Page through the sheet and convert it with bounded memory')
+    parser.add_argument('--duplicates-report', type=str, default=None, help='Save the superseded duplicate responses to this JSON file (in batch mode, one <output name>.<file name> per input)')
+    parser.add_argument('--profile', type=str, default=None, help='Save a JSON report of the time, rows, API calls and peak memory of every stage')
+    parser.add_argument('--profile-cprofile', type=str, default=None, help='Save a cProfile dump (pstats format, e.g. for snakeviz or flameprof)')
+    parser.add_argument('--export', type=str, action='append', default=[], choices=sorted(EXPORT_EXTENSIONS),
+                        help='Also export the unstyled result next to the output file (repeatable)')
+    parser.add_argument('--no-xlsx', action='store_true', help='Do not write the styled workbook, only the --export files')
+    parser.add_argument('--consolidate', action='store_true',
+                        help='Merge all the input spreadsheets (e.g. one per ward) into a single sheet of the output file')
+    parser.add_argument('--watch', action='store_true', help='Keep running and reconvert whenever the spreadsheet changes')
+    parser.add_argument('--interval', type=float, default=60, help='Seconds between two change polls in watch mode')
+    parser.add_argument('--max-backoff', type=float, default=900, help='Maximum seconds to wait after repeated failures in watch mode')
+    parser.add_argument('--rate-limit', type=float, default=FETCH_RATE_PER_MINUTE, help='Maximum number of API requests per minute')
+    parser.add_argument('--max-retries', type=int, default=FETCH_MAX_RETRIES, help='Retries of a throttled (429) or failed (5xx) API request')
+    parser.add_argument('--cache-dir', type=str, default=CACHE_DIR, help='Directory of the local snapshot cache')
     
     args = parser.parse_args()
-    gsheet_to_xlsx(args.gsheet_path, args.output_path, column_mapping)
+    if args.offline and args.refresh:
+        parser.error('--offline and --refresh cannot be used together')
+    if args.fetch_concurrency <= 0:
+        parser.error('--fetch-concurrency must be at least 1')
+    if args.rate_limit <= 0:
+        parser.error('--rate-limit must be positive')
+    if args.consolidate and (args.batch or args.watch or args.incremental or args.export or args.no_xlsx):
+        parser.error('--consolidate cannot be combined with --batch, --watch, --incremental, --export or --no-xlsx')
+    batch = args.batch or len(args.gsheet_path) > 1 or os.path.isdir(args.gsheet_path[0]) or glob.has_magic(args.gsheet_path[0])
+    if args.stream and batch and not args.consolidate:
+        parser.error('--stream cannot be combined with --batch or several inputs: the batch workers convert whole files')
+    if args.watch and (batch or args.offline or args.refresh or args.stream
+                       or args.profile or args.profile_cprofile or args.rate_limit != FETCH_RATE_PER_MINUTE
+                       or args.max_retries != FETCH_MAX_RETRIES):
+        parser.error('--watch converts a single file and cannot be combined with --batch, --offline, --refresh, --stream, '
+                     '--profile, --profile-cprofile, --rate-limit or --max-retries')
+    if args.watch:
+        watch_gsheet(args.gsheet_path[0], args.output_path, column_mapping, interval=args.interval, max_backoff=args.max_backoff,
+                     cache_dir=args.cache_dir, incremental=args.incremental, duplicates_report_path=args.duplicates_report,
+                     export_formats=args.export, write_xlsx=not args.no_xlsx)
+        sys.exit(0)
+
+    if args.profile:
+        set_profiler(Profiler())
+    cprofile = cProfile.Profile() if args.profile_cprofile else None
+    if cprofile:
+        cprofile.enable()
+    exit_code = 0
+    try:
+        if not args.consolidate and batch:
+            # Only the fetch and scheduling of the main process are profiled, not the worker processes
+            results = gsheets_to_xlsx_batch(args.gsheet_path, args.output_path, column_mapping,
+                                            offline=args.offline, refresh=args.refresh, cache_dir=args.cache_dir,
+                                            incremental=args.incremental, fetch_concurrency=args.fetch_concurrency,
+                                            max_workers=args.jobs, export_formats=args.export,
+                                            write_xlsx=not args.no_xlsx, rate_per_minute=args.rate_limit,
+                                            max_retries=args.max_retries,
+                                            duplicates_report_name=args.duplicates_report and os.path.basename(args.duplicates_report))
+            exit_code = 0 if all(error is None for error in results.values()) else 1
+        elif args.consolidate:
+            consolidate_to_xlsx(expand_gsheet_paths(args.gsheet_path), args.output_path, column_mapping,
+                                offline=args.offline, refresh=args.refresh, cache_dir=args.cache_dir,
+                                rate_per_minute=args.rate_limit, max_retries=args.max_retries,
+                                duplicates_report_path=args.duplicates_report)
+        else:
+            gsheet_to_xlsx(args.gsheet_path[0], args.output_path, column_mapping,
+                           offline=args.offline, refresh=args.refresh, cache_dir=args.cache_dir,
+                           incremental=args.incremental, stream=args.stream,
+                           duplicates_report_path=args.duplicates_report,
+                           export_formats=args.export, write_xlsx=not args.no_xlsx,
+                           rate_per_minute=args.rate_limit, max_retries=args.max_retries)
+    finally:
+        if cprofile:
+            cprofile.disable()
+            cprofile.dump_stats(args.profile_cprofile)
+            print(f"* cProfile dump saved to {args.profile_cprofile}")
+        if args.profile:
+            PROFILER.save(args.profile)
+            set_profiler(None)
+            print(f"* Profile report saved to {args.profile}")
+    sys.exit(exit_code)
 
     # gsheet_to_xlsx("Khảo sát nhân khẩu KP 23 CCCD 2025.gsheet", "output.xlsx", column_mapping)
 